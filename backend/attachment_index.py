@@ -0,0 +1,94 @@
+import os
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Per-conversation vector index over attached PDFs
+ATTACHMENT_TOP_K = int(os.getenv("ATTACHMENT_TOP_K", "5"))
+ATTACHMENT_TOKEN_BUDGET = int(os.getenv("ATTACHMENT_TOKEN_BUDGET", "700"))  # estimated tokens of attachment context
+ATTACHMENT_INDEX_TTL = float(os.getenv("ATTACHMENT_INDEX_TTL", "1800"))  # idle seconds before eviction
+ATTACHMENT_MAX_CHUNKS = int(os.getenv("ATTACHMENT_MAX_CHUNKS", "2000"))  # per conversation
+ATTACHMENT_MAX_CONVERSATIONS = int(os.getenv("ATTACHMENT_MAX_CONVERSATIONS", "256"))
+
+
+class ConversationIndex:
+    """Unit-normalized chunk vectors for one conversation, searched by dot product."""
+
+    def __init__(self):
+        self.vectors = None  # (n, d) float32
+        self.chunks = []     # parallel list of {"text", "source", "file_key", "chunk_index"}
+        self.file_keys = set()
+        self.last_used = time.time()
+
+    def add(self, source, file_key, chunks, vectors):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms > 0, norms, 1.0)
+        self.vectors = matrix if self.vectors is None else np.vstack([self.vectors, matrix])
+        self.chunks.extend({"text": text, "source": source, "file_key": file_key, "chunk_index": i}
+                           for i, text in enumerate(chunks))
+        self.file_keys.add(file_key)
+
+    def search(self, query_vector, k, with_vectors=False):
+        if self.vectors is None:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        if with_vectors:
+            return [dict(self.chunks[i], score=float(scores[i]), vector=self.vectors[i]) for i in top]
+        return [dict(self.chunks[i], score=float(scores[i])) for i in top]
+
+
+class AttachmentIndexStore:
+    """In-process map of conversation id -> ConversationIndex with idle eviction."""
+
+    def __init__(self, ttl=ATTACHMENT_INDEX_TTL, max_conversations=ATTACHMENT_MAX_CONVERSATIONS):
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self._indexes = {}
+
+    def evict_idle(self):
+        now = time.time()
+        for conversation_id in [cid for cid, idx in self._indexes.items() if now - idx.last_used > self.ttl]:
+            print(f"Evicting idle attachment index for conversation {conversation_id}")
+            del self._indexes[conversation_id]
+
+    def get(self, conversation_id):
+        self.evict_idle()
+        index = self._indexes.get(conversation_id)
+        if index is not None:
+            index.last_used = time.time()
+        return index
+
+    def has_file(self, conversation_id, file_key):
+        index = self.get(conversation_id)
+        return index is not None and file_key in index.file_keys
+
+    def add(self, conversation_id, source, file_key, chunks, vectors):
+        self.evict_idle()
+        index = self._indexes.get(conversation_id)
+        if index is None:
+            if len(self._indexes) >= self.max_conversations:
+                oldest = min(self._indexes, key=lambda cid: self._indexes[cid].last_used)
+                del self._indexes[oldest]
+            index = self._indexes[conversation_id] = ConversationIndex()
+        index.add(source, file_key, chunks, vectors)
+        index.last_used = time.time()
+
+    def search(self, conversation_id, query_vector, k=ATTACHMENT_TOP_K, with_vectors=False):
+        index = self.get(conversation_id)
+        return index.search(query_vector, k, with_vectors) if index is not None else []
+
+    def drop(self, conversation_id):
+        self._indexes.pop(conversation_id, None)
+
+
+attachment_indexes = AttachmentIndexStore()
@@ -0,0 +1,69 @@
+import os
+import time
+import threading
+from dataclasses import dataclass
+from sqlalchemy import event, inspect
+from dotenv import load_dotenv
+from .database import User
+
+load_dotenv()
+
+# Short-lived cache of token subject (email) -> user identity
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Identity of the authenticated caller; enough for endpoints without touching the DB."""
+    id: int
+    email: str
+
+
+class UserIdentityCache:
+    def __init__(self, ttl=AUTH_CACHE_TTL, max_size=AUTH_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[email]
+            self.misses += 1
+            return None
+
+    def set(self, identity: CurrentUser):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                # Drop the oldest entry; dicts keep insertion order
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[identity.email] = (identity, time.monotonic())
+
+    def invalidate(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserIdentityCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    """Drops cached identities whenever a User row is changed or deleted."""
+    user_cache.invalidate(target.email)
+    # An email change would otherwise leave the old subject cached
+    for old_email in inspect(target).attrs.email.history.deleted or ():
+        user_cache.invalidate(old_email)
@@ -0,0 +1,62 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from .database import SessionLocal, AsyncSessionLocal, Conversation, Message
+from . import history
+
+
+async def run_db(fn, *args):
+    """Runs `fn(session, *args)` in a single transaction and returns its result.
+
+    Uses the asyncpg engine when DB_ASYNC is enabled (sync ORM code runs via
+    run_sync without a thread); otherwise a psycopg2 session in the threadpool.
+    Objects returned by `fn` stay readable after the commit.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            async with session.begin():
+                return await session.run_sync(fn, *args)
+
+    def call():
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            result = fn(db, *args)
+            db.commit()
+            return result
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    return await run_in_threadpool(call)
+
+
+def load_turn(db: Session, user_id: int, conversation_id: Optional[int], title: str):
+    """Read phase of a chat turn: returns (conversation_id, chat_history).
+
+    A new conversation row is inserted when `conversation_id` is empty, since
+    its id is needed (attachment index, streamed `meta` event) before generation.
+    """
+    if not conversation_id:
+        conversation = Conversation(title=title, user_id=user_id)
+        db.add(conversation)
+        db.flush()
+        return conversation.id, ""
+
+    conversation = db.query(Conversation).filter(Conversation.id == conversation_id, Conversation.user_id == user_id).first()
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    # Load a bounded window of recent history, trimmed to the token budget and
+    # prefixed with the rolling summary
+    recent = history.load_history_window(db, conversation)
+    return conversation_id, history.format_history(conversation, recent)
+
+
+def save_turn(db: Session, conversation_id: int, user_content: str, user_created_at: datetime, bot_response: str):
+    """Write phase of a chat turn: stores the user and bot messages together."""
+    db.add(Message(conversation_id=conversation_id, sender="user", content=user_content, created_at=user_created_at))
+    db.add(Message(conversation_id=conversation_id, sender="bot", content=bot_response))
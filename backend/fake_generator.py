@@ -0,0 +1,61 @@
+import os
+import random
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Offline stand-in for Gemini generation (GENERATION_BACKEND=fake), used for load tests
+FAKE_GEN_LATENCY = float(os.getenv("FAKE_GEN_LATENCY", "0.5"))  # seconds before the first token
+FAKE_GEN_TOKENS = int(os.getenv("FAKE_GEN_TOKENS", "150"))  # tokens per answer
+FAKE_GEN_TOKENS_PER_SEC = float(os.getenv("FAKE_GEN_TOKENS_PER_SEC", "80"))
+FAKE_GEN_ERROR_RATE = float(os.getenv("FAKE_GEN_ERROR_RATE", "0"))  # share of calls that fail
+FAKE_GEN_STREAM_CHUNK = 8  # tokens per streamed fragment
+
+WORDS = "the model answers using retrieved context from the knowledge base and attached documents".split()
+
+
+class FakePart:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStream:
+    """Async iterator of FakeParts paced at FAKE_GEN_TOKENS_PER_SEC."""
+
+    def __init__(self, tokens, tokens_per_sec):
+        self.tokens = tokens
+        self.tokens_per_sec = tokens_per_sec
+
+    async def __aiter__(self):
+        for start in range(0, len(self.tokens), FAKE_GEN_STREAM_CHUNK):
+            fragment = self.tokens[start:start + FAKE_GEN_STREAM_CHUNK]
+            await asyncio.sleep(len(fragment) / self.tokens_per_sec)
+            yield FakePart(" ".join(fragment) + " ")
+
+
+class FakeGenerativeModel:
+    """Mimics genai.GenerativeModel.generate_content_async with configurable latency.
+
+    Waits FAKE_GEN_LATENCY seconds (time to first token), then emits
+    FAKE_GEN_TOKENS tokens at FAKE_GEN_TOKENS_PER_SEC, either all at once or
+    as a stream. FAKE_GEN_ERROR_RATE of calls raise, to exercise fallbacks.
+    """
+
+    def __init__(self, model_name, latency=FAKE_GEN_LATENCY, tokens=FAKE_GEN_TOKENS,
+                 tokens_per_sec=FAKE_GEN_TOKENS_PER_SEC, error_rate=FAKE_GEN_ERROR_RATE):
+        self.model_name = model_name
+        self.latency = latency
+        self.tokens = tokens
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+
+    async def generate_content_async(self, contents, stream=False):
+        await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise Exception(f"503 Fake generator error from {self.model_name}")
+        tokens = [WORDS[i % len(WORDS)] for i in range(self.tokens)]
+        if stream:
+            return FakeStream(tokens, self.tokens_per_sec)
+        await asyncio.sleep(len(tokens) / self.tokens_per_sec)
+        return FakePart(" ".join(tokens))
@@ -0,0 +1,113 @@
+import os
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from chunking import estimate_tokens
+from .database import Conversation, Message
+
+load_dotenv()
+
+# Conversation history sent with each /api/chat turn
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "20"))  # max messages fetched (~10 pairs)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+# Summarize once this many unsummarized messages are older than the window (they
+# stay in the prompt until then; messages over the token budget are summarized at once)
+SUMMARY_MIN_MESSAGES = int(os.getenv("SUMMARY_MIN_MESSAGES", "6"))
+SUMMARY_MAX_MESSAGES = int(os.getenv("SUMMARY_MAX_MESSAGES", "40"))  # per summarization pass
+
+
+def load_history_window(db: Session, conversation: Conversation, exclude_id: int = None):
+    """Fetches the messages not yet folded into the summary (oldest first) with a single LIMIT query.
+
+    The summary cutoff is the window's lower bound, so messages waiting for the
+    next summarization pass stay in the prompt. At most HISTORY_WINDOW +
+    SUMMARY_MAX_MESSAGES are loaded (more only pile up if summarization fails).
+    """
+    query = db.query(Message).filter(Message.conversation_id == conversation.id)
+    if conversation.summary_message_id is not None:
+        query = query.filter(Message.id > conversation.summary_message_id)
+    if exclude_id is not None:
+        query = query.filter(Message.id != exclude_id)
+    rows = (
+        query.order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(HISTORY_WINDOW + SUMMARY_MAX_MESSAGES)
+        .all()
+    )
+    rows.reverse()
+    return rows
+
+
+def _format_message(msg) -> str:
+    role = "User" if msg.sender == "user" else "Assistant"
+    return f"{role}: {msg.content}"
+
+
+def _summary_line(conversation: Conversation):
+    return f"Summary of earlier conversation: {conversation.summary}" if conversation.summary else None
+
+
+def fitting_start(conversation: Conversation, messages, token_budget: int = HISTORY_TOKEN_BUDGET) -> int:
+    """Index of the oldest of `messages` kept in the prompt: the newest ones fit in `token_budget` with the summary."""
+    summary_line = _summary_line(conversation)
+    used = estimate_tokens(summary_line) if summary_line else 0
+    start = len(messages)
+    while start > 0:
+        cost = estimate_tokens(_format_message(messages[start - 1]))
+        if start < len(messages) and used + cost > token_budget:
+            break
+        used += cost
+        start -= 1
+    return start
+
+
+def format_history(conversation: Conversation, messages, token_budget: int = HISTORY_TOKEN_BUDGET) -> str:
+    """Renders the rolling summary plus as many of the newest messages as fit in `token_budget`."""
+    summary_line = _summary_line(conversation)
+    lines = [summary_line] if summary_line else []
+    lines.extend(_format_message(msg) for msg in messages[fitting_start(conversation, messages, token_budget):])
+    return "\n".join(lines)
+
+
+def pending_summary_messages(db: Session, conversation_id: int):
+    """Messages to fold into the summary now (oldest first); empty when no pass is due.
+
+    A pass is due once SUMMARY_MIN_MESSAGES unsummarized messages are older
+    than the newest HISTORY_WINDOW, or as soon as any unsummarized message no
+    longer fits HISTORY_TOKEN_BUDGET: those are already missing from the
+    prompt, so they are folded in right away.
+    """
+    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    if conversation is None:
+        return None, []
+    messages = load_history_window(db, conversation)
+    trimmed = fitting_start(conversation, messages)
+    beyond_window = max(0, len(messages) - HISTORY_WINDOW)
+    if not trimmed and beyond_window < SUMMARY_MIN_MESSAGES:
+        return conversation, []
+    boundary_id = messages[max(trimmed, beyond_window)].id if max(trimmed, beyond_window) < len(messages) else None
+    # Oldest first from the summary cutoff, so nothing loaded past the LIMIT above is skipped
+    query = db.query(Message).filter(Message.conversation_id == conversation_id)
+    if conversation.summary_message_id is not None:
+        query = query.filter(Message.id > conversation.summary_message_id)
+    if boundary_id is not None:
+        query = query.filter(Message.id < boundary_id)
+    pending = query.order_by(Message.id.asc()).limit(SUMMARY_MAX_MESSAGES).all()
+    return conversation, pending
+
+
+def build_summary_prompt(previous_summary: str, messages) -> str:
+    transcript = "\n".join(_format_message(msg) for msg in messages)
+    return (
+        "Update the running summary of a conversation between a user and an assistant. "
+        "Keep facts, names, decisions and open questions; stay under 200 words.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New messages:\n{transcript}\n\n"
+        "Updated summary:"
+    )
+
+
+def store_summary(db: Session, conversation_id: int, summary: str, upto_message_id: int):
+    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    if conversation is None:
+        return
+    conversation.summary = summary
+    conversation.summary_message_id = upto_message_id
@@ -0,0 +1,108 @@
+import os
+import time
+import asyncio
+import importlib
+from fastapi.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+import retrieve
+import embeddings
+import vector_store
+from . import database
+from .model_router import GENERATION_BACKEND
+
+load_dotenv()
+
+# Create/migrate tables at startup (turn off when migrations run elsewhere, to start faster)
+INIT_DB_ON_STARTUP = os.getenv("INIT_DB_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# After the clients exist, also open DB connections, touch the collection, embed a
+# query and import the PDF/OCR libraries so the first real request doesn't pay for it
+WARMUP = os.getenv("WARMUP", "false").lower() in ("1", "true", "yes")
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "2"))
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "warm-up query")
+# Libraries only needed for attachments; imported on first upload otherwise
+PARSER_MODULES = ("pypdf", "PIL.Image", "pytesseract")
+
+
+class Readiness:
+    """Startup progress reported by /ready: per-step durations and the first failure."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.ready = False
+        self.error = None
+        self.steps = {}  # step -> seconds, in completion order
+
+    async def run(self, name, step, required=True):
+        start = time.perf_counter()
+        try:
+            result = step()
+            if asyncio.iscoroutine(result):
+                result = await result
+        except Exception as e:
+            print(f"Startup step {name} failed: {e}")
+            if required and self.error is None:
+                self.error = f"{name}: {e}"
+            return None
+        self.steps[name] = round(time.perf_counter() - start, 3)
+        return result
+
+    def snapshot(self):
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "warmup": WARMUP,
+            "uptime_seconds": round(time.monotonic() - self.started_at, 3),
+            "steps": self.steps,
+        }
+
+
+readiness = Readiness()
+
+
+def _import_parsers():
+    for module in PARSER_MODULES:
+        importlib.import_module(module)
+
+
+async def _prime_embedding_and_search():
+    provider = embeddings.get_provider()
+    vector = (await provider.aembed([WARMUP_QUERY], "retrieval_query"))[0]
+    await vector_store.get_store().search_async(retrieve.COLLECTION_NAME, vector, 1)
+
+
+async def init_db():
+    """Creates/migrates tables before the app serves (skipped with INIT_DB_ON_STARTUP=false)."""
+    if INIT_DB_ON_STARTUP:
+        await readiness.run("init_db", lambda: run_in_threadpool(database.init_db))
+
+
+async def start(model_router):
+    """Creates the backend's clients, optionally warms them up, then marks the app ready.
+
+    Runs as a background task from the lifespan handler, so the server accepts
+    connections right away; requests arriving earlier create whatever they need
+    on first use. A failure to create a client (e.g. a missing API key) is
+    reported by /ready instead of crashing the worker.
+    """
+    await readiness.run("vector_store", lambda: run_in_threadpool(vector_store.get_store))
+    await readiness.run("embedding_provider", lambda: run_in_threadpool(embeddings.get_provider))
+    if GENERATION_BACKEND != "fake":
+        await readiness.run("generation_client", lambda: run_in_threadpool(retrieve.get_genai))
+    await readiness.run("generation_model", lambda: run_in_threadpool(model_router.model, model_router.model_names[0]))
+
+    if WARMUP:
+        await readiness.run("db_pool", lambda: run_in_threadpool(database.warm_pool, WARMUP_DB_CONNECTIONS), required=False)
+        await readiness.run("db_async_pool", lambda: database.warm_async_pool(WARMUP_DB_CONNECTIONS), required=False)
+        await readiness.run("collection_check", retrieve.ensure_collection_matches_async, required=False)
+        await readiness.run("embed_and_search", _prime_embedding_and_search, required=False)
+        await readiness.run("parsers", lambda: run_in_threadpool(_import_parsers), required=False)
+
+    readiness.ready = readiness.error is None
+    status = "ready" if readiness.ready else f"not ready ({readiness.error})"
+    print(f"Backend {status} after {time.monotonic() - readiness.started_at:.2f}s: {readiness.steps}")
+
+
+async def stop():
+    """Closes vector store clients and pooled DB connections."""
+    await vector_store.close_store_async()
+    await database.dispose_engines()
@@ -1,8 +1,11 @@
-from fastapi import FastAPI, HTTPException, Depends, Form, File, UploadFile, status
+from fastapi import FastAPI, HTTPException, Depends, Form, File, UploadFile, BackgroundTasks, Query, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from .database import SessionLocal, engine, Base, Conversation, Message, User
+from sqlalchemy import func, and_, or_
+from .database import SessionLocal, Conversation, Message, User
 from . import database
 import bcrypt
 from jose import JWTError, jwt
@@ -10,25 +13,49 @@ from datetime import datetime, timedelta
 import sys
 import os
 import io
-import time
-import pytesseract
-from PIL import Image
-
-# Configure tesseract executable path
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+import json
+import base64
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
 
 # Add parent directory to sys.path to import retrieve.py
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
 import retrieve
+import corpus_version
+import extraction_cache
+import embedding_cache
+import metrics
+import context_packing
+from chunking import iter_chunks, NearDuplicateFilter
+from .attachment_index import attachment_indexes, ATTACHMENT_MAX_CHUNKS, ATTACHMENT_TOP_K, ATTACHMENT_TOKEN_BUDGET
+from . import history
+from .auth_cache import CurrentUser, user_cache
+from .chat_store import run_db, load_turn, save_turn
+from .model_router import ModelRouter, GENERATION_MODELS, GENERATION_BACKEND
+from .fake_generator import FakeGenerativeModel
+from .response_cache import response_cache, RESPONSE_CACHE_ENABLED
+from .request_metrics import timing_middleware, cache_collector, router_collector, PROMPT_CHARS, RESPONSE_CHARS
+from . import lifecycle
 
-from pypdf import PdfReader
 from pydantic import BaseModel
 from typing import List, Optional
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Tesseract executable used for image OCR
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", r'C:\Program Files\Tesseract-OCR\tesseract.exe')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Creates tables, then creates and warms up clients in the background (see lifecycle.py)."""
+    await lifecycle.init_db()
+    startup = asyncio.create_task(lifecycle.start(model_router))
+    yield
+    startup.cancel()
+    await lifecycle.stop()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,7 +72,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.middleware("http")(timing_middleware)
 
 # JWT and Security variables
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-that-should-be-in-env")
@@ -76,7 +105,8 @@ def get_db():
     finally:
         db.close()
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user(token: str = Depends(oauth2_scheme)) -> CurrentUser:
+    """Resolves the bearer token to a CurrentUser, hitting the DB only on a cache miss."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -89,10 +119,19 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == email).first()
+    identity = user_cache.get(email)
+    if identity is not None:
+        return identity
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+    finally:
+        db.close()
     if user is None:
         raise credentials_exception
-    return user
+    identity = CurrentUser(id=user.id, email=user.email)
+    user_cache.set(identity)
+    return identity
 
 class MessageSchema(BaseModel):
     id: int
@@ -108,10 +147,22 @@ class ConversationSchema(BaseModel):
     title: str
     created_at: datetime
     messages: List[MessageSchema] = []
+    has_more: bool = False  # older messages exist before the returned page
 
     class Config:
         from_attributes = True
 
+class ConversationSummarySchema(BaseModel):
+    id: int
+    title: str
+    created_at: datetime
+    message_count: int
+    last_message_preview: Optional[str] = None
+
+class ConversationPageSchema(BaseModel):
+    items: List[ConversationSummarySchema]
+    next_cursor: Optional[str] = None
+
 
 class UserCreate(BaseModel):
     email: str
@@ -123,7 +174,7 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
-MAX_PDF_CHARS = 8000  # Limit PDF text to avoid slow Gemini responses
+MAX_PDF_CHARS = 8000  # Fallback limit when a PDF can't be indexed
 
 @app.post("/api/auth/signup")
 def signup(user: UserCreate, db: Session = Depends(get_db)):
@@ -149,11 +200,35 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/api/auth/me", response_model=UserResponse)
-def get_me(current_user: User = Depends(get_current_user)):
+def get_me(current_user: CurrentUser = Depends(get_current_user)):
     return current_user
 
-def extract_pdf_text(file_bytes: bytes) -> str:
-    """Extract text from PDF bytes using pypdf, truncated to MAX_PDF_CHARS."""
+def cached_extraction(file_bytes: bytes, kind: str, compute, *settings) -> str:
+    """Looks up extracted text by content hash so re-uploaded files skip OCR/parsing."""
+    cache = extraction_cache.get_default_cache()
+    if cache is None:
+        return compute(file_bytes)
+    key = extraction_cache.make_key(file_bytes, kind, *settings)
+    return cache.get_or_compute(key, lambda: compute(file_bytes))
+
+def _ocr_image_bytes(file_bytes: bytes) -> str:
+    # Imported on first use: only image uploads need them
+    import pytesseract
+    from PIL import Image
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    img = Image.open(io.BytesIO(file_bytes))
+    return pytesseract.image_to_string(img)
+
+def ocr_image_bytes(file_bytes: bytes) -> str:
+    """Runs Tesseract OCR over image bytes (cached). CPU-bound; call via run_in_threadpool."""
+    return cached_extraction(file_bytes, "image-ocr", _ocr_image_bytes)
+
+def extract_pdf_text(file_bytes: bytes, max_chars: Optional[int] = MAX_PDF_CHARS) -> str:
+    """Extract text from PDF bytes using pypdf, truncated to `max_chars` (None = whole document, cached)."""
+    return cached_extraction(file_bytes, "pdf-text", lambda data: _extract_pdf_text(data, max_chars), max_chars)
+
+def _extract_pdf_text(file_bytes: bytes, max_chars: Optional[int]) -> str:
+    from pypdf import PdfReader
     reader = PdfReader(io.BytesIO(file_bytes))
     pages_text = []
     total_len = 0
@@ -162,52 +237,71 @@ def extract_pdf_text(file_bytes: bytes) -> str:
         if text:
             pages_text.append(f"[Page {i+1}]\n{text}")
             total_len += len(text)
-            if total_len >= MAX_PDF_CHARS:
+            if max_chars and total_len >= max_chars:
                 break
     full_text = "\n\n".join(pages_text)
-    if len(full_text) > MAX_PDF_CHARS:
-        full_text = full_text[:MAX_PDF_CHARS] + "\n\n[... truncated for speed ...]"
+    if max_chars and len(full_text) > max_chars:
+        full_text = full_text[:max_chars] + "\n\n[... truncated for speed ...]"
     return full_text
 
 
-@app.post("/api/chat")
-async def chat(
-    message: str = Form(...),
-    conversation_id: Optional[int] = Form(None),
-    file: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    user_message = message
-    has_attachment = False
+def create_model(name: str):
+    """GenerativeModel for `name`, or the offline stand-in when GENERATION_BACKEND=fake."""
+    if GENERATION_BACKEND == "fake":
+        return FakeGenerativeModel(name)
+    return retrieve.get_genai().GenerativeModel(name)
+
+
+model_router = ModelRouter(GENERATION_MODELS, create_model)
+
+metrics.register_collector(router_collector(model_router))
+metrics.register_collector(cache_collector({
+    "embedding": embedding_cache.get_default_cache,
+    "extraction": extraction_cache.get_default_cache,
+    "response": lambda: response_cache if RESPONSE_CACHE_ENABLED else None,
+}))
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus metrics: stage/request latency histograms, cache, model and size stats."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health", include_in_schema=False)
+def health():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+
+@app.get("/ready", include_in_schema=False)
+def ready():
+    """Readiness: 200 once clients are created (and warmed up with WARMUP=true), else 503."""
+    snapshot = lifecycle.readiness.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+
+async def read_attachment(file: Optional[UploadFile]):
+    """Reads an uploaded PDF/image and returns (attachment_name, pdf_bytes, image_ocr_text, image_parts)."""
     attachment_name = None
-    pdf_context = ""
+    pdf_bytes = None
     image_ocr_text = ""
     image_parts = None
 
-    # Handle uploaded file
     if file and file.filename:
         filename_lower = file.filename.lower()
         if filename_lower.endswith(".pdf"):
-            has_attachment = True
             attachment_name = file.filename
-            try:
-                file_bytes = await file.read()
-                pdf_context = extract_pdf_text(file_bytes)
-                print(f"Extracted {len(pdf_context)} chars from PDF: {attachment_name}")
-            except Exception as e:
-                print(f"Error extracting PDF text: {e}")
-                pdf_context = f"[Error reading PDF: {e}]"
+            pdf_bytes = await file.read()
         elif filename_lower.endswith((".png", ".jpg", ".jpeg", ".webp", ".heic", ".heif")):
-            has_attachment = True
             attachment_name = file.filename
             try:
                 file_bytes = await file.read()
                 
                 # Extract text using Tesseract OCR
                 try:
-                    img = Image.open(io.BytesIO(file_bytes))
-                    extracted_text = pytesseract.image_to_string(img)
+                    with metrics.stage("ocr"):
+                        extracted_text = await run_in_threadpool(ocr_image_bytes, file_bytes)
                     if extracted_text.strip():
                         image_ocr_text = extracted_text.strip()
                         print(f"Extracted {len(image_ocr_text)} chars using OCR")
@@ -224,91 +318,191 @@ async def chat(
             except Exception as e:
                 print(f"Error reading image: {e}")
 
-    # Create new conversation if not provided
-    if not conversation_id:
-        conversation = Conversation(title=user_message[:30] + "...", user_id=current_user.id)
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
-        conversation_id = conversation.id
-    else:
-        conversation = db.query(Conversation).filter(Conversation.id == conversation_id, Conversation.user_id == current_user.id).first()
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-
-    # Save user message (include attachment indicator)
-    display_content = user_message
-    if has_attachment:
-        display_content = f"📎 {attachment_name}\n\n{user_message}"
-    db_message = Message(conversation_id=conversation_id, sender="user", content=display_content)
-    db.add(db_message)
-    db.commit()
+    return attachment_name, pdf_bytes, image_ocr_text, image_parts
+
+
+def chunk_attachment(text: str) -> List[str]:
+    """Deduplicated chunks of an attachment, stopping at ATTACHMENT_MAX_CHUNKS."""
+    return list(itertools.islice(iter_chunks([text], dedup=NearDuplicateFilter()), ATTACHMENT_MAX_CHUNKS))
+
+
+async def index_pdf_attachment(conversation_id: int, attachment_name: str, pdf_bytes: bytes):
+    """Parses the whole PDF, chunks and embeds it into the conversation's attachment index.
+
+    Hashing, extraction and chunking (MinHash dedup takes seconds on a long
+    document) all run in the threadpool so the event loop keeps serving.
+    """
+    file_key = await run_in_threadpool(extraction_cache.make_key, pdf_bytes, "pdf")
+    if attachment_indexes.has_file(conversation_id, file_key):
+        return
+    with metrics.stage("pdf_extract"):
+        full_text = await run_in_threadpool(extract_pdf_text, pdf_bytes, None)
+    with metrics.stage("pdf_chunk"):
+        chunks = await run_in_threadpool(chunk_attachment, full_text or "")
+    if not chunks:
+        print(f"No text extracted from PDF: {attachment_name}")
+        return
+    vectors = await retrieve.embed_documents_async(chunks)
+    attachment_indexes.add(conversation_id, attachment_name, file_key, chunks, vectors)
+    print(f"Indexed {len(chunks)} chunks ({len(full_text)} chars) from PDF: {attachment_name}")
+
+
+async def build_pdf_context(conversation_id: int, user_message: str, attachment_name: Optional[str], pdf_bytes: Optional[bytes]) -> str:
+    """Returns the attached-PDF chunks most relevant to this question.
+
+    A newly uploaded PDF is indexed first; PDFs from earlier turns stay in the
+    conversation's index until it goes idle. If indexing fails the prompt falls
+    back to the first MAX_PDF_CHARS of the document.
+    """
+    if pdf_bytes is not None:
+        try:
+            await index_pdf_attachment(conversation_id, attachment_name, pdf_bytes)
+        except Exception as e:
+            print(f"Error indexing PDF, falling back to truncated text: {e}")
+            try:
+                with metrics.stage("pdf_extract"):
+                    return await run_in_threadpool(extract_pdf_text, pdf_bytes)
+            except Exception as e:
+                print(f"Error extracting PDF text: {e}")
+                return f"[Error reading PDF: {e}]"
 
-    # Load conversation history (last 10 messages for context)
-    history_messages = (
-        db.query(Message)
-        .filter(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at.asc())
-        .all()
-    )
-    # Build chat history string (exclude the current message, keep last 10 pairs)
-    chat_history = ""
-    history_list = history_messages[:-1]  # exclude the message we just added
-    if history_list:
-        recent = history_list[-20:]  # last 20 messages (~10 pairs)
-        history_lines = []
-        for msg in recent:
-            role = "User" if msg.sender == "user" else "Assistant"
-            history_lines.append(f"{role}: {msg.content}")
-        chat_history = "\n".join(history_lines)
+    if attachment_indexes.get(conversation_id) is None:
+        return ""
+    try:
+        query_vector = await retrieve.get_embedding_async(user_message)
+    except Exception as e:
+        print(f"Error embedding query for attachment search: {e}")
+        return ""
+    fetch = max(ATTACHMENT_TOP_K, context_packing.RETRIEVAL_CANDIDATES)
+    with metrics.stage("attachment_search"):
+        hits = attachment_indexes.search(conversation_id, query_vector, fetch, with_vectors=fetch > ATTACHMENT_TOP_K)
+    with metrics.stage("rerank"):
+        hits = context_packing.select(query_vector, hits, ATTACHMENT_TOP_K, budget=ATTACHMENT_TOKEN_BUDGET)
+    return "\n\n".join(f"[{hit['source']}]\n{hit['text']}" for hit in hits)
 
-    # Get RAG response
+
+def user_display_content(user_message: str, attachment_name: Optional[str]) -> str:
+    """User message as stored/displayed, with an attachment indicator."""
+    if attachment_name:
+        return f"📎 {attachment_name}\n\n{user_message}"
+    return user_message
+
+
+async def refresh_conversation_summary(conversation_id: int):
+    """Background task: folds messages leaving the history window or token budget into the rolling summary."""
     try:
-        search_results = retrieve.search(user_message)
-        # Construct context from search results
-        rag_context = "\n\n".join([f"Source: {res['source']}\nContent: {res['text']}" for res in search_results])
-
-        # Build the full prompt
-        prompt_parts = []
-        prompt_parts.append("You are a helpful assistant. Answer the user query based on the following context.\n")
-
-        if chat_history:
-            prompt_parts.append(f"--- Conversation History ---\n{chat_history}\n--- End of History ---\n")
-
-        if pdf_context:
-            prompt_parts.append(f"--- Attached PDF Content ---\n{pdf_context}\n--- End of PDF ---\n")
-        elif image_ocr_text:
-            prompt_parts.append(f"--- Extracted Image Text (OCR) ---\n{image_ocr_text}\n--- End of OCR Text ---\n")
-            if rag_context:
-                prompt_parts.append(f"--- Knowledge Base Context ---\n{rag_context}\n--- End of Knowledge Base ---\n")
-        elif rag_context:
+        conversation, pending = await run_db(history.pending_summary_messages, conversation_id)
+        if conversation is None or not pending:
+            return
+        prompt = history.build_summary_prompt(conversation.summary, pending)
+        with metrics.stage("summary_generation"):
+            response = await generate_with_fallback([prompt])
+        await run_db(history.store_summary, conversation_id, response.text.strip(), pending[-1].id)
+        print(f"Updated summary for conversation {conversation_id} ({len(pending)} messages folded in)")
+    except Exception as e:
+        print(f"Error updating conversation summary: {e}")
+
+
+def build_contents(user_message: str, chat_history: str, search_results: list, pdf_context: str, image_ocr_text: str, image_parts):
+    """Assembles the Gemini request contents from history, attachments and retrieved context."""
+    # Construct context from search results
+    rag_context = "\n\n".join([f"Source: {res['source']}\nContent: {res['text']}" for res in search_results])
+
+    # Build the full prompt
+    prompt_parts = []
+    prompt_parts.append("You are a helpful assistant. Answer the user query based on the following context.\n")
+
+    if chat_history:
+        prompt_parts.append(f"--- Conversation History ---\n{chat_history}\n--- End of History ---\n")
+
+    if pdf_context:
+        prompt_parts.append(f"--- Attached PDF Content ---\n{pdf_context}\n--- End of PDF ---\n")
+    elif image_ocr_text:
+        prompt_parts.append(f"--- Extracted Image Text (OCR) ---\n{image_ocr_text}\n--- End of OCR Text ---\n")
+        if rag_context:
             prompt_parts.append(f"--- Knowledge Base Context ---\n{rag_context}\n--- End of Knowledge Base ---\n")
+    elif rag_context:
+        prompt_parts.append(f"--- Knowledge Base Context ---\n{rag_context}\n--- End of Knowledge Base ---\n")
 
-        prompt_parts.append(f"User: {user_message}")
-        prompt = "\n".join(prompt_parts)
+    prompt_parts.append(f"User: {user_message}")
+    prompt = "\n".join(prompt_parts)
 
-        contents = [prompt]
-        if image_parts:
-            contents.extend(image_parts)
+    PROMPT_CHARS.observe(len(prompt))
 
-        response = None
-        last_error = None
-        for model_name in ['gemini-2.0-flash', 'gemini-2.5-flash', 'gemini-1.5-flash']:
-            try:
-                print(f"Generating content with model: {model_name}")
-                model = retrieve.genai.GenerativeModel(model_name)
-                response = model.generate_content(contents)
-                if response:
-                    break
-            except Exception as e:
-                print(f"Error generating with {model_name}: {e}")
-                last_error = e
-                time.sleep(1)
+    contents = [prompt]
+    if image_parts:
+        contents.extend(image_parts)
+    return contents
+
+
+async def generate_with_fallback(contents, stream=False):
+    """Generates with the model router (circuit breakers + hedging across GENERATION_MODELS)."""
+    return await model_router.generate(contents, stream=stream)
 
-        if not response:
-            raise last_error if last_error else Exception("Failed to generate content with any model")
 
-        bot_response = response.text
+async def lookup_cached_answer(user_message: str, has_attachment: bool, chat_history: str):
+    """Checks the semantic response cache for a stateless turn.
+
+    Returns (cache_key, hit): cache_key is (query_vector, corpus_version) to pass to
+    store_cached_answer on a miss, or None when the turn isn't cacheable.
+    """
+    if not RESPONSE_CACHE_ENABLED or has_attachment or chat_history:
+        return None, None
+    try:
+        query_vector = await retrieve.get_embedding_async(user_message)
+    except Exception as e:
+        print(f"Response cache lookup skipped: {e}")
+        return None, None
+    version = corpus_version.get_version(retrieve.COLLECTION_NAME)
+    hit = response_cache.lookup(query_vector, version)
+    if hit:
+        print(f"Response cache hit for query: {user_message}")
+    return (query_vector, version), hit
+
+
+def store_cached_answer(cache_key, bot_response: str, search_results: list):
+    if cache_key is not None:
+        query_vector, version = cache_key
+        response_cache.store(query_vector, version, bot_response, search_results)
+
+
+def sse_event(event: str, data) -> str:
+    """Formats a single Server-Sent Event frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/chat")
+async def chat(
+    background_tasks: BackgroundTasks,
+    message: str = Form(...),
+    conversation_id: Optional[int] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    user_message = message
+    user_created_at = datetime.utcnow()
+    attachment_name, pdf_bytes, image_ocr_text, image_parts = await read_attachment(file)
+    has_attachment = attachment_name is not None
+
+    with metrics.stage("history_load"):
+        conversation_id, chat_history = await run_db(load_turn, current_user.id, conversation_id, user_message[:30] + "...")
+    pdf_context = await build_pdf_context(conversation_id, user_message, attachment_name, pdf_bytes)
+
+    # Get RAG response
+    search_results = []
+    try:
+        cache_key, cached = await lookup_cached_answer(user_message, has_attachment, chat_history)
+        if cached:
+            bot_response = cached["response"]
+            search_results = cached["search_results"]
+        else:
+            search_results = await retrieve.search_async(user_message)
+            with metrics.stage("prompt_build"):
+                contents = build_contents(user_message, chat_history, search_results, pdf_context, image_ocr_text, image_parts)
+            with metrics.stage("generation"):
+                response = await generate_with_fallback(contents)
+                bot_response = response.text
+            store_cached_answer(cache_key, bot_response, search_results)
 
     except Exception as e:
         import traceback
@@ -317,36 +511,220 @@ async def chat(
         print(tb_str)
         bot_response = f"I'm sorry, I encountered an error: {str(e)}\n\nTraceback:\n{tb_str}"
 
-    # Save bot message
-    db_bot_message = Message(conversation_id=conversation_id, sender="bot", content=bot_response)
-    db.add(db_bot_message)
-    db.commit()
+    # Save the user and bot messages in one transaction
+    RESPONSE_CHARS.observe(len(bot_response))
+    with metrics.stage("db_commit"):
+        await run_db(save_turn, conversation_id, user_display_content(user_message, attachment_name), user_created_at, bot_response)
+    background_tasks.add_task(refresh_conversation_summary, conversation_id)
 
     return {
         "response": bot_response,
         "conversation_id": conversation_id,
-        "search_results": search_results if 'search_results' in dir() else [],
+        "search_results": search_results,
         "has_attachment": has_attachment,
         "attachment_name": attachment_name,
     }
 
-@app.get("/api/conversations", response_model=List[ConversationSchema])
-def get_conversations(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    conversations = db.query(Conversation).filter(Conversation.user_id == current_user.id).order_by(Conversation.created_at.desc()).all()
-    return conversations
+
+@app.post("/api/chat/stream")
+async def chat_stream(
+    message: str = Form(...),
+    conversation_id: Optional[int] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Same turn as /api/chat, streamed as Server-Sent Events.
+
+    Emits `meta` (conversation id), `sources` (retrieved chunks), one `token`
+    event per generated text fragment, then `done` or `error`. The user and bot
+    messages are persisted when the stream finishes or the client disconnects.
+    """
+    user_message = message
+    user_created_at = datetime.utcnow()
+    attachment_name, pdf_bytes, image_ocr_text, image_parts = await read_attachment(file)
+
+    with metrics.stage("history_load"):
+        conversation_id, chat_history = await run_db(load_turn, current_user.id, conversation_id, user_message[:30] + "...")
+
+    async def event_stream():
+        chunks = []
+        completed = False
+        try:
+            yield sse_event("meta", {
+                "conversation_id": conversation_id,
+                "has_attachment": attachment_name is not None,
+                "attachment_name": attachment_name,
+            })
+
+            pdf_context = await build_pdf_context(conversation_id, user_message, attachment_name, pdf_bytes)
+
+            cache_key, cached = await lookup_cached_answer(user_message, attachment_name is not None, chat_history)
+            if cached:
+                yield sse_event("sources", cached["search_results"])
+                chunks.append(cached["response"])
+                yield sse_event("token", {"text": cached["response"]})
+            else:
+                search_results = await retrieve.search_async(user_message)
+                yield sse_event("sources", search_results)
+
+                with metrics.stage("prompt_build"):
+                    contents = build_contents(user_message, chat_history, search_results, pdf_context, image_ocr_text, image_parts)
+                with metrics.stage("generation"):
+                    response = await generate_with_fallback(contents, stream=True)
+                with metrics.stage("generation_stream"):
+                    async for part in response:
+                        try:
+                            text = part.text
+                        except ValueError:
+                            # Fragments without text (e.g. safety metadata) carry nothing to stream
+                            continue
+                        if text:
+                            chunks.append(text)
+                            yield sse_event("token", {"text": text})
+                store_cached_answer(cache_key, "".join(chunks), search_results)
+
+            completed = True
+            yield sse_event("done", {"conversation_id": conversation_id})
+
+        except Exception as e:
+            print(f"Error during streaming RAG/Generation: {e}")
+            chunks.append(f"I'm sorry, I encountered an error: {str(e)}")
+            completed = True
+            yield sse_event("error", {"detail": str(e)})
+
+        finally:
+            bot_response = "".join(chunks)
+            if not completed:
+                print(f"Stream cancelled for conversation {conversation_id} after {len(bot_response)} chars")
+                bot_response += "\n\n[... response interrupted ...]"
+            RESPONSE_CHARS.observe(len(bot_response))
+            # Shielded so a client disconnect can't cancel the write halfway
+            with metrics.stage("db_commit"):
+                await asyncio.shield(run_db(
+                    save_turn, conversation_id, user_display_content(user_message, attachment_name), user_created_at, bot_response
+                ))
+
+    background_tasks = BackgroundTasks()
+    background_tasks.add_task(refresh_conversation_summary, conversation_id)
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks,
+    )
+
+PREVIEW_CHARS = 120
+
+def encode_cursor(created_at: datetime, conversation_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{conversation_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, conversation_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(conversation_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/conversations", response_model=ConversationPageSchema)
+def get_conversations(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Lists conversation summaries, newest first, with keyset pagination.
+
+    The page of conversations is read first (ix_conversations_user_created);
+    message counts and last-message previews are then aggregated over that
+    page's conversations only, so the cost doesn't grow with total messages.
+    """
+    query = (
+        db.query(Conversation.id, Conversation.title, Conversation.created_at)
+        .filter(Conversation.user_id == current_user.id)
+    )
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Conversation.created_at < cursor_created_at,
+            and_(Conversation.created_at == cursor_created_at, Conversation.id < cursor_id),
+        ))
+    rows = query.order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(limit + 1).all()
+    page = rows[:limit]
+
+    stats = {}
+    if page:
+        counts = (
+            db.query(
+                Message.conversation_id.label("conversation_id"),
+                func.count(Message.id).label("message_count"),
+                func.max(Message.id).label("last_message_id"),
+            )
+            .filter(Message.conversation_id.in_([conv_id for conv_id, _, _ in page]))
+            .group_by(Message.conversation_id)
+            .subquery()
+        )
+        for conv_id, message_count, preview in (
+            db.query(counts.c.conversation_id, counts.c.message_count, func.substr(Message.content, 1, PREVIEW_CHARS))
+            .join(Message, Message.id == counts.c.last_message_id)
+        ):
+            stats[conv_id] = (message_count, preview)
+
+    items = [
+        ConversationSummarySchema(
+            id=conv_id,
+            title=title,
+            created_at=created_at,
+            message_count=stats.get(conv_id, (0, None))[0],
+            last_message_preview=stats.get(conv_id, (0, None))[1],
+        )
+        for conv_id, title, created_at in page
+    ]
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if len(rows) > limit else None
+    return ConversationPageSchema(items=items, next_cursor=next_cursor)
 
 @app.get("/api/conversations/{conversation_id}", response_model=ConversationSchema)
-def get_conversation(conversation_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_conversation(
+    conversation_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Returns a conversation with its messages (oldest first).
+
+    With `limit`, only the newest `limit` messages older than `before_id` are
+    returned and `has_more` tells whether another page exists.
+    """
     conversation = db.query(Conversation).filter(Conversation.id == conversation_id, Conversation.user_id == current_user.id).first()
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    return conversation
+
+    query = db.query(Message).filter(Message.conversation_id == conversation_id)
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    has_more = False
+    if limit is None:
+        messages = query.order_by(Message.created_at.asc(), Message.id.asc()).all()
+    else:
+        messages = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = list(reversed(messages[:limit]))
+
+    return ConversationSchema(
+        id=conversation.id,
+        title=conversation.title,
+        created_at=conversation.created_at,
+        messages=[MessageSchema.model_validate(msg) for msg in messages],
+        has_more=has_more,
+    )
 
 @app.delete("/api/conversations/{conversation_id}")
-def delete_conversation(conversation_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def delete_conversation(conversation_id: int, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
     conversation = db.query(Conversation).filter(Conversation.id == conversation_id, Conversation.user_id == current_user.id).first()
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     db.delete(conversation)
     db.commit()
+    attachment_indexes.drop(conversation_id)
     return {"message": "Conversation deleted"}
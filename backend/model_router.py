@@ -0,0 +1,195 @@
+import os
+import time
+import asyncio
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# gemini, or fake for the offline stand-in in fake_generator.py (load tests)
+GENERATION_BACKEND = os.getenv("GENERATION_BACKEND", "gemini")
+# Generation models in preference order
+GENERATION_MODELS = [m.strip() for m in os.getenv("GENERATION_MODELS", "gemini-2.0-flash,gemini-2.5-flash,gemini-1.5-flash").split(",") if m.strip()]
+# Consecutive failures that open a model's circuit, and how long it stays open
+ROUTER_FAILURE_THRESHOLD = int(os.getenv("ROUTER_FAILURE_THRESHOLD", "3"))
+ROUTER_OPEN_SECONDS = float(os.getenv("ROUTER_OPEN_SECONDS", "30"))
+# Hedging: start the next model if the current one hasn't answered by its p95 latency
+ROUTER_HEDGING = os.getenv("ROUTER_HEDGING", "true").lower() in ("1", "true", "yes")
+ROUTER_HEDGE_MIN_SECONDS = float(os.getenv("ROUTER_HEDGE_MIN_SECONDS", "1.0"))
+ROUTER_HEDGE_DEFAULT_SECONDS = float(os.getenv("ROUTER_HEDGE_DEFAULT_SECONDS", "10.0"))  # until enough samples
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "100"))  # latency samples kept per model
+ROUTER_MIN_SAMPLES = 10
+
+
+class ModelState:
+    """Rolling latency window and circuit breaker for a single model."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = deque(maxlen=ROUTER_WINDOW)
+        self.outcomes = deque(maxlen=ROUTER_WINDOW)  # True = success
+        self.consecutive_failures = 0
+        self.opened_at = None  # set while the circuit is open
+        self.probing = False   # a half-open trial request is in flight
+        self.requests = 0
+        self.failures = 0
+        self.hedged = 0        # times a hedge was fired because this model was slow
+        self.served = 0        # responses returned to the caller
+
+    def p95(self):
+        if len(self.latencies) < ROUTER_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= ROUTER_OPEN_SECONDS:
+            return "half_open"
+        return "open"
+
+    def allows_request(self):
+        state = self.state()
+        if state == "closed":
+            return True
+        return state == "half_open" and not self.probing
+
+    def record_success(self, latency):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.consecutive_failures >= ROUTER_FAILURE_THRESHOLD:
+            if self.opened_at is None:
+                print(f"Circuit opened for model {self.name} after {self.consecutive_failures} failures")
+            self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        total = len(self.outcomes)
+        return {
+            "state": self.state(),
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedged": self.hedged,
+            "served": self.served,
+            "error_rate": (self.outcomes.count(False) / total) if total else 0.0,
+            "p95_seconds": self.p95(),
+        }
+
+
+class ModelRouter:
+    """Routes generation across models with circuit breakers and p95-based hedging.
+
+    Models are tried in preference order, skipping any whose circuit is open.
+    A failure starts the next model immediately. With hedging, a slow model
+    gets a parallel request to the next model once its p95 deadline passes.
+    The first successful response wins and the other requests are cancelled.
+    GenerativeModel instances are created once per model and reused.
+    """
+
+    def __init__(self, model_names, model_factory, hedging=ROUTER_HEDGING):
+        self.model_names = list(model_names)
+        self.model_factory = model_factory
+        self.hedging = hedging
+        self.states = {name: ModelState(name) for name in self.model_names}
+        self._models = {}
+        self.fallbacks = 0  # responses served by a model other than the first candidate
+
+    def model(self, name):
+        if name not in self._models:
+            self._models[name] = self.model_factory(name)
+        return self._models[name]
+
+    def candidates(self):
+        available = [name for name in self.model_names if self.states[name].allows_request()]
+        if not available:
+            # Every circuit is open: still try rather than fail the request outright
+            print("All model circuits open; trying models in preference order")
+            return list(self.model_names)
+        return available
+
+    def hedge_delay(self, name):
+        p95 = self.states[name].p95()
+        if p95 is None:
+            return ROUTER_HEDGE_DEFAULT_SECONDS
+        return max(ROUTER_HEDGE_MIN_SECONDS, p95)
+
+    async def _call(self, name, contents, stream):
+        state = self.states[name]
+        state.requests += 1
+        if state.state() == "half_open":
+            state.probing = True
+        print(f"Generating content with model: {name}")
+        start = time.monotonic()
+        try:
+            response = await self.model(name).generate_content_async(contents, stream=stream)
+        except asyncio.CancelledError:
+            state.probing = False
+            raise
+        except Exception:
+            state.record_failure()
+            raise
+        if not response:
+            state.record_failure()
+            raise Exception(f"Empty response from {name}")
+        state.record_success(time.monotonic() - start)
+        return response
+
+    async def generate(self, contents, stream=False):
+        candidates = self.candidates()
+        pending = {}  # task -> (model name, launched at)
+        next_idx = 0
+        last_error = None
+
+        def launch():
+            nonlocal next_idx
+            name = candidates[next_idx]
+            next_idx += 1
+            pending[asyncio.create_task(self._call(name, contents, stream))] = (name, time.monotonic())
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if self.hedging and next_idx < len(candidates):
+                    # Deadline of the most recently launched request
+                    newest_name, launched_at = max(pending.values(), key=lambda v: v[1])
+                    timeout = max(0.0, launched_at + self.hedge_delay(newest_name) - time.monotonic())
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.states[newest_name].hedged += 1
+                    print(f"Model {newest_name} slower than {self.hedge_delay(newest_name):.1f}s; hedging with {candidates[next_idx]}")
+                    launch()
+                    continue
+
+                for task in done:
+                    name, _ = pending.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        print(f"Error generating with {name}: {e}")
+                        last_error = e
+                        if next_idx < len(candidates):
+                            launch()
+                        continue
+                    self.states[name].served += 1
+                    if name != candidates[0]:
+                        self.fallbacks += 1
+                    return response
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error if last_error else Exception("Failed to generate content with any model")
+
+    def stats(self):
+        return {name: state.snapshot() for name, state in self.states.items()}
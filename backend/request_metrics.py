@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import random
+from datetime import datetime
+from fastapi import Request
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+# Requests slower than this are logged with their stage breakdown (0 = never)
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "5"))
+# Log the stage breakdown of every request as one JSON line
+TIMING_LOG = os.getenv("TIMING_LOG", "false").lower() in ("1", "true", "yes")
+# Share of requests run under pyinstrument (optional dependency); profiles of slow ones are saved
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+REQUEST_SECONDS = metrics.histogram(
+    "rag_http_request_seconds",
+    "Time until the response starts (headers sent for streamed responses)",
+    ("method", "route", "status"),
+)
+PROMPT_CHARS = metrics.histogram("rag_prompt_chars", "Size of the generation prompt", buckets=metrics.SIZE_BUCKETS)
+RESPONSE_CHARS = metrics.histogram("rag_response_chars", "Size of the generated answer", buckets=metrics.SIZE_BUCKETS)
+
+_profiler_missing = False
+
+
+def _start_profiler():
+    global _profiler_missing
+    if PROFILE_SAMPLE_RATE <= 0 or _profiler_missing or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        print("PROFILE_SAMPLE_RATE is set but pyinstrument is not installed (pip install pyinstrument)")
+        _profiler_missing = True
+        return None
+    profiler = Profiler(async_mode="enabled")
+    profiler.start()
+    return profiler
+
+
+def _save_profile(profiler, route):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{route.strip('/').replace('/', '_') or 'root'}.html"
+    path = os.path.join(PROFILE_DIR, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profiler.output_html())
+    return path
+
+
+async def timing_middleware(request: Request, call_next):
+    """Records request latency, adds a Server-Timing header and logs slow requests.
+
+    Stage timings come from metrics.stage() blocks run while handling the
+    request. For streamed responses only the stages before the first byte are
+    in the header; later ones still land in the /metrics histograms.
+    """
+    timings = metrics.start_request()
+    profiler = _start_profiler()
+    start = time.perf_counter()
+    response = None
+    try:
+        response = await call_next(request)
+        return response
+    finally:
+        # Also runs when the handler raised: recorded as a 500 and the profiler is stopped
+        elapsed = time.perf_counter() - start
+        status = response.status_code if response is not None else 500
+        route = request.scope.get("route")
+        route = getattr(route, "path", "unmatched")  # templated path keeps label cardinality low
+        REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=status)
+        if response is not None:
+            response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+
+        slow = SLOW_REQUEST_SECONDS > 0 and elapsed >= SLOW_REQUEST_SECONDS
+        profile_path = None
+        if profiler is not None:
+            profiler.stop()
+            if slow:
+                profile_path = _save_profile(profiler, route)
+        if slow or TIMING_LOG:
+            print(json.dumps({
+                "event": "slow_request" if slow else "request_timing",
+                "method": request.method,
+                "route": route,
+                "status": status,
+                "total_ms": round(elapsed * 1000, 1),
+                "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in timings.items()},
+                "profile": profile_path,
+            }))
+
+
+def _gauge_lines(name, help, samples):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+    return lines
+
+
+def _counter_lines(name, help, samples):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+    lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+    return lines
+
+
+def cache_collector(caches):
+    """Exposes hits/misses/hit ratio of caches given as {name: callable returning the cache or None}."""
+    def collect():
+        stats = []
+        for name, get_cache in caches.items():
+            cache = get_cache()
+            if cache is not None:
+                stats.append((f'{{cache="{name}"}}', cache.hits, cache.misses))
+        lines = _counter_lines("rag_cache_hits_total", "Cache hits", [(labels, hits) for labels, hits, _ in stats])
+        lines += _counter_lines("rag_cache_misses_total", "Cache misses", [(labels, misses) for labels, _, misses in stats])
+        lines += _gauge_lines("rag_cache_hit_ratio", "Cache hit ratio since start", [
+            (labels, hits / (hits + misses) if hits + misses else 0.0) for labels, hits, misses in stats
+        ])
+        return lines
+    return collect
+
+
+def router_collector(router):
+    """Exposes the model router's per-model request, failure, hedge and fallback counts."""
+    def collect():
+        snapshots = router.stats()
+        per_model = [(f'{{model="{name}"}}', snap) for name, snap in snapshots.items()]
+        lines = _counter_lines("rag_model_requests_total", "Generation calls started per model",
+                               [(labels, snap["requests"]) for labels, snap in per_model])
+        lines += _counter_lines("rag_model_failures_total", "Failed generation calls per model",
+                                [(labels, snap["failures"]) for labels, snap in per_model])
+        lines += _counter_lines("rag_model_hedges_total", "Hedged requests fired because the model was slow",
+                                [(labels, snap["hedged"]) for labels, snap in per_model])
+        lines += _counter_lines("rag_model_served_total", "Responses returned per model",
+                                [(labels, snap["served"]) for labels, snap in per_model])
+        lines += _counter_lines("rag_model_fallbacks_total", "Responses served by a model other than the first choice",
+                                [("", router.fallbacks)])
+        lines += _gauge_lines("rag_model_circuit_open", "1 while the model's circuit breaker is open",
+                              [(labels, int(snap["state"] == "open")) for labels, snap in per_model])
+        return lines
+    return collect
@@ -0,0 +1,98 @@
+import os
+import time
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Opt-in semantic answer cache for stateless /api/chat turns
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))  # min cosine similarity
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # seconds, 0 disables expiry
+
+
+class SemanticResponseCache:
+    """Stores answers keyed by query embedding; lookups match on cosine similarity.
+
+    Every entry is tagged with the knowledge-base version it was generated
+    against. When the version changes (re-ingestion) all entries are dropped.
+    Eviction is least-recently-used once `max_size` entries are held.
+    """
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE, threshold=RESPONSE_CACHE_THRESHOLD, ttl=RESPONSE_CACHE_TTL):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._version = None
+        self._vectors = None  # (n, d) float32 matrix of unit vectors
+        self._entries = []    # parallel list of dicts: answer, sources, created_at, last_used
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vector):
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _reset(self, version):
+        self._version = version
+        self._vectors = None
+        self._entries = []
+
+    def _remove(self, idx):
+        self._vectors = np.delete(self._vectors, idx, axis=0)
+        del self._entries[idx]
+        if not self._entries:
+            self._vectors = None
+
+    def lookup(self, vector, version):
+        """Returns {"response", "search_results"} for a similar cached query, or None."""
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            if self._vectors is None:
+                self.misses += 1
+                return None
+
+            sims = self._vectors @ self._unit(vector)
+            idx = int(np.argmax(sims))
+            entry = self._entries[idx]
+            if sims[idx] < self.threshold:
+                self.misses += 1
+                return None
+            if self.ttl > 0 and time.time() - entry["created_at"] > self.ttl:
+                self._remove(idx)
+                self.misses += 1
+                return None
+
+            entry["last_used"] = time.time()
+            self.hits += 1
+            return {"response": entry["answer"], "search_results": entry["sources"]}
+
+    def store(self, vector, version, answer, sources):
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            unit = self._unit(vector)[None, :]
+            if self._vectors is not None and len(self._entries) >= self.max_size:
+                lru = min(range(len(self._entries)), key=lambda i: self._entries[i]["last_used"])
+                self._remove(lru)
+            now = time.time()
+            self._vectors = unit if self._vectors is None else np.vstack([self._vectors, unit])
+            self._entries.append({"answer": answer, "sources": sources, "created_at": now, "last_used": now})
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
+response_cache = SemanticResponseCache()
@@ -1,8 +1,8 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { BrowserRouter as Router, Routes, Route, Navigate } from 'react-router-dom';
 import Sidebar from './components/Sidebar';
 import ChatWindow from './components/ChatWindow';
-import { getConversations, getConversation, sendMessage, deleteConversation, getUser } from './api';
+import { getConversations, getConversation, streamMessage, deleteConversation, getUser } from './api';
 import Login from './pages/Login';
 import Signup from './pages/Signup';
 
@@ -16,9 +16,14 @@ const ProtectedRoute = ({ children }) => {
 
 function ChatApp() {
   const [conversations, setConversations] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [currentConversationId, setCurrentConversationId] = useState(null);
   const [messages, setMessages] = useState([]);
   const [loading, setLoading] = useState(false);
+  const [thinking, setThinking] = useState(false); // waiting for the first streamed token
+  // Conversation created by the turn being streamed: its messages are already on screen
+  const skipLoadRef = useRef(null);
   const [activeTab, setActiveTab] = useState('ask');
   const [userEmail, setUserEmail] = useState('');
 
@@ -37,7 +42,9 @@ function ChatApp() {
   };
 
   useEffect(() => {
-    if (currentConversationId) {
+    if (currentConversationId && currentConversationId === skipLoadRef.current) {
+      skipLoadRef.current = null;
+    } else if (currentConversationId) {
       loadMessages(currentConversationId);
     } else {
       setMessages([]);
@@ -47,12 +54,31 @@ function ChatApp() {
   const loadConversations = async () => {
     try {
       const data = await getConversations();
-      setConversations(data);
+      setConversations(data.items || []);
+      setNextCursor(data.next_cursor || null);
     } catch (error) {
       console.error("Failed to load conversations", error);
     }
   };
 
+  // Appends the next page of older conversations
+  const loadMoreConversations = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const data = await getConversations(nextCursor);
+      setConversations((prev) => {
+        const seen = new Set(prev.map((conv) => conv.id));
+        return [...prev, ...(data.items || []).filter((conv) => !seen.has(conv.id))];
+      });
+      setNextCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error("Failed to load more conversations", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const loadMessages = async (id) => {
     setLoading(true);
     try {
@@ -75,33 +101,46 @@ function ChatApp() {
       created_at: new Date().toISOString(),
       attachment: file ? file.name : null,
     };
+    const botId = Date.now() + 1;
+    let started = false;
+    let newConversationId = null;
     setMessages((prev) => [...prev, tempMessage]);
     setLoading(true);
+    setThinking(true);
+
+    // Appends streamed text to the bot message, creating it on the first fragment
+    const appendBotText = (chunk) => {
+      if (!started) {
+        started = true;
+        setThinking(false);
+        setMessages((prev) => [...prev, { id: botId, sender: 'bot', content: chunk, created_at: new Date().toISOString() }]);
+      } else {
+        setMessages((prev) => prev.map((msg) => (msg.id === botId ? { ...msg, content: msg.content + chunk } : msg)));
+      }
+    };
 
     try {
-      const response = await sendMessage(text, currentConversationId, file);
-
-      // Update conversation ID if it was a new chat
-      if (!currentConversationId) {
-        setCurrentConversationId(response.conversation_id);
+      await streamMessage(text, currentConversationId, file, (event, data) => {
+        if (event === 'meta' && !currentConversationId) {
+          newConversationId = data.conversation_id;
+          skipLoadRef.current = newConversationId;
+          setCurrentConversationId(newConversationId);
+        } else if (event === 'token') {
+          appendBotText(data.text);
+        } else if (event === 'error') {
+          appendBotText(`I'm sorry, I encountered an error: ${data.detail}`);
+        }
+      });
+      if (newConversationId) {
         loadConversations(); // Refresh list to show new chat
       }
-
-      // Add bot response
-      const botMessage = {
-        id: Date.now() + 1,
-        sender: 'bot',
-        content: response.response,
-        created_at: new Date().toISOString()
-      };
-      setMessages((prev) => [...prev, botMessage]);
-
     } catch (error) {
       console.error("Failed to send message", error);
       // Show error in chat
-      setMessages((prev) => [...prev, { id: Date.now(), sender: 'bot', content: "Error sending message.", created_at: new Date().toISOString() }]);
+      appendBotText(started ? "\n\n[... response interrupted ...]" : "Error sending message.");
     } finally {
       setLoading(false);
+      setThinking(false);
     }
   };
 
@@ -137,6 +176,9 @@ function ChatApp() {
         onSelect={handleSelectConversation}
         onNewChat={handleNewChat}
         onDelete={handleDeleteConversation}
+        hasMore={Boolean(nextCursor)}
+        loadingMore={loadingMore}
+        onLoadMore={loadMoreConversations}
         activeTab={activeTab}
         onTabChange={setActiveTab}
         userEmail={userEmail}
@@ -147,6 +189,7 @@ function ChatApp() {
             messages={messages}
             onSendMessage={handleSendMessage}
             loading={loading}
+            thinking={thinking}
           />
         ) : (
           <div className="flex flex-col items-center justify-center h-full bg-white text-center px-8">
@@ -54,7 +54,9 @@ export const getUser = async () => {
     return response.data;
 };
 
-export const sendMessage = async (message, conversationId, file = null) => {
+// Streams a chat turn over Server-Sent Events. `onEvent(event, data)` is called for
+// each `meta`, `sources`, `token`, `done` or `error` event as it arrives.
+export const streamMessage = async (message, conversationId, file = null, onEvent = () => {}, signal = undefined) => {
     const formData = new FormData();
     formData.append('message', message);
     if (conversationId) {
@@ -63,20 +65,64 @@ export const sendMessage = async (message, conversationId, file = null) => {
     if (file) {
         formData.append('file', file);
     }
-    const response = await api.post(`/chat`, formData, {
-        headers: { 'Content-Type': 'multipart/form-data' },
-        timeout: 120000, // 2 minute timeout for PDF processing
+    const token = localStorage.getItem('token');
+    const response = await fetch(`${API_URL}/chat/stream`, {
+        method: 'POST',
+        headers: token ? { 'Authorization': `Bearer ${token}` } : {},
+        body: formData,
+        signal,
     });
-    return response.data;
+    if (response.status === 401) {
+        // Same handling as the axios interceptor above
+        localStorage.removeItem('token');
+        window.location.href = '/login';
+    }
+    if (!response.ok) {
+        throw new Error(`Stream request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            let data = '';
+            for (const line of frame.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            onEvent(event, data ? JSON.parse(data) : null);
+        }
+    }
 };
 
-export const getConversations = async () => {
-    const response = await api.get(`/conversations`);
+// Returns { items, next_cursor }; pass next_cursor back to load the following page.
+export const getConversations = async (cursor = null, limit = 50) => {
+    const params = { limit };
+    if (cursor) {
+        params.cursor = cursor;
+    }
+    const response = await api.get(`/conversations`, { params });
     return response.data;
 };
 
-export const getConversation = async (id) => {
-    const response = await api.get(`/conversations/${id}`);
+// With `limit`, returns the newest `limit` messages before `beforeId` and a `has_more` flag.
+export const getConversation = async (id, limit = null, beforeId = null) => {
+    const params = {};
+    if (limit) {
+        params.limit = limit;
+    }
+    if (beforeId) {
+        params.before_id = beforeId;
+    }
+    const response = await api.get(`/conversations/${id}`, { params });
     return response.data;
 };
 
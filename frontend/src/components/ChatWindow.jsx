@@ -3,7 +3,7 @@ import MessageInput from './MessageInput';
 import { User, Bot, FileText, Image as ImageIcon } from 'lucide-react';
 import BotLogo from './BotLogo'; // Import the new logo component
 
-const ChatWindow = ({ messages, onSendMessage, loading }) => {
+const ChatWindow = ({ messages, onSendMessage, loading, thinking = loading }) => {
     const messagesEndRef = useRef(null);
 
     const scrollToBottom = () => {
@@ -12,7 +12,7 @@ const ChatWindow = ({ messages, onSendMessage, loading }) => {
 
     useEffect(() => {
         scrollToBottom();
-    }, [messages, loading]);
+    }, [messages, thinking]);
 
     return (
         <div className="flex flex-col h-full bg-white text-gray-800 w-full relative font-sans">
@@ -59,7 +59,7 @@ const ChatWindow = ({ messages, onSendMessage, loading }) => {
                         ))
                     )}
 
-                    {loading && (
+                    {thinking && (
                         <div className="flex w-full justify-start">
                             <div className="flex max-w-[85%] md:max-w-[75%] gap-4 flex-row">
                                 <div className="w-8 h-8 rounded-full overflow-hidden flex-shrink-0 border border-gray-200 bg-white flex items-center justify-center">
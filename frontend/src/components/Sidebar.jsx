@@ -2,7 +2,7 @@ import React from 'react';
 import { PlusCircle, MessageSquare, Trash2, MessagesSquare, BookOpen, LogOut } from 'lucide-react';
 import { logout } from '../api';
 
-const Sidebar = ({ conversations, currentId, onSelect, onNewChat, onDelete, activeTab, onTabChange, userEmail }) => {
+const Sidebar = ({ conversations, currentId, onSelect, onNewChat, onDelete, hasMore, loadingMore, onLoadMore, activeTab, onTabChange, userEmail }) => {
 
     return (
         <div className="w-[260px] bg-slate-900 border-r border-slate-800 flex flex-col h-full shrink-0 text-slate-100 transition-all duration-300 font-sans">
@@ -69,6 +69,15 @@ const Sidebar = ({ conversations, currentId, onSelect, onNewChat, onDelete, acti
                                 </div>
                             </div>
                         ))}
+                        {hasMore && (
+                            <button
+                                onClick={onLoadMore}
+                                disabled={loadingMore}
+                                className="w-full px-3 py-2 mb-2 rounded-md text-xs font-medium text-slate-400 hover:text-slate-200 hover:bg-slate-800/50 transition-colors disabled:opacity-50"
+                            >
+                                {loadingMore ? 'Loading...' : 'Load more'}
+                            </button>
+                        )}
                         {conversations.length === 0 && (
                             <div className="text-center text-slate-500 text-xs mt-8 px-4">
                                 No conversations yet. Start a new chat!
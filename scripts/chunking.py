@@ -0,0 +1,230 @@
+import os
+import re
+import zlib
+from collections import deque
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Default chunking used by ingestion and per-conversation attachment indexes (estimated tokens)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "100"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "20"))
+# A paragraph or page end closes the chunk once it holds this share of CHUNK_TOKENS
+BOUNDARY_FILL = 0.5
+# Drop a chunk when this share of it repeats chunks already kept (0 disables)
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+# Shingles are character n-grams of the text reduced to [a-z0-9], so OCR slips
+# (a misread letter, a lost space) break only a few of them
+DEDUP_SHINGLE_CHARS = 5
+DEDUP_WINDOW = 16  # recently kept chunks checked exactly (about a page: its OCR echoes land here)
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+
+# Rough subword tokens: words in pieces of up to 6 characters, plus punctuation
+_TOKEN_RE = re.compile(r"\w{1,6}|[^\w\s]")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+# Lines added by extraction ("--- OCR Data ---", "[Page 3]") start a new section
+_SECTION_MARKER_RE = re.compile(r"^\s*(?:---[^\n]*---|\[Page \d+\])\s*$", re.M)
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+_LIST_MARKER_RE = re.compile(r"^(?:\d{1,2}|[a-zA-Z])[.)]$")
+
+
+def estimate_tokens(text):
+    """Approximate model tokens (~4 characters each for English prose) without a tokenizer."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def split_sentences(paragraph):
+    """Splits a paragraph (line breaks are treated as spaces) into sentences."""
+    text = re.sub(r"\s+", " ", paragraph).strip()
+    if not text:
+        return []
+    sentences = []
+    for part in _SENTENCE_END_RE.split(text):
+        if sentences and _LIST_MARKER_RE.match(sentences[-1]):
+            # "... category. 2. General AI ..." -> keep "2." with its item
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return sentences
+
+
+def iter_units(text):
+    """Yields (break_before, sentence) for one page; break_before is "section", "paragraph" or None."""
+    for s, section in enumerate(_SECTION_MARKER_RE.split(text)):
+        for p, paragraph in enumerate(_PARAGRAPH_RE.split(section)):
+            for i, sentence in enumerate(split_sentences(paragraph)):
+                if i:
+                    yield None, sentence
+                else:
+                    yield ("section" if s and not p else "paragraph"), sentence
+
+
+def _split_long(sentence, chunk_tokens):
+    """Cuts a sentence longer than `chunk_tokens` into word windows."""
+    pieces, words, size = [], [], 0
+    for word in sentence.split(" "):
+        tokens = estimate_tokens(word)
+        if words and size + tokens > chunk_tokens:
+            pieces.append(" ".join(words))
+            words, size = [], 0
+        words.append(word)
+        size += tokens
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+
+def iter_chunks(texts, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, dedup=None):
+    """Streams chunks of about `chunk_tokens` tokens over an iterable of texts (pages).
+
+    Chunks are whole sentences. A chunk also ends at a section marker, and at a
+    paragraph or page end once it is BOUNDARY_FILL full; only chunks cut for
+    size carry up to `overlap_tokens` of trailing sentences into the next. Only
+    the current page is held in memory. `dedup` (a NearDuplicateFilter) drops
+    chunks that repeat ones already emitted.
+    """
+    current = []  # (sentence, tokens)
+    size = 0
+
+    def take(carry_overlap):
+        nonlocal current, size
+        text = " ".join(sentence for sentence, _ in current)
+        carried, carried_size = [], 0
+        if carry_overlap:
+            for sentence, tokens in reversed(current[1:]):
+                if carried_size + tokens > overlap_tokens:
+                    break
+                carried.insert(0, (sentence, tokens))
+                carried_size += tokens
+        current, size = carried, carried_size
+        if dedup is not None and dedup.is_duplicate(text):
+            return None
+        return text
+
+    for text in texts:
+        for break_before, sentence in iter_units(text or ""):
+            if current and (break_before == "section" or
+                            (break_before == "paragraph" and size >= chunk_tokens * BOUNDARY_FILL)):
+                chunk = take(carry_overlap=False)
+                if chunk:
+                    yield chunk
+            for piece in _split_long(sentence, chunk_tokens):
+                tokens = estimate_tokens(piece)
+                if current and size + tokens > chunk_tokens:
+                    chunk = take(carry_overlap=True)
+                    if chunk:
+                        yield chunk
+                    if size + tokens > chunk_tokens:
+                        current, size = [], 0  # the overlap would not leave room for the piece
+                current.append((piece, tokens))
+                size += tokens
+        # Page end
+        if current and size >= chunk_tokens * BOUNDARY_FILL:
+            chunk = take(carry_overlap=False)
+            if chunk:
+                yield chunk
+    if current:
+        chunk = take(carry_overlap=False)
+        if chunk:
+            yield chunk
+
+
+def chunk_text(text, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, dedup=None):
+    """Splits text into sentence-aligned chunks of about `chunk_tokens` tokens."""
+    if not text:
+        return []
+    return list(iter_chunks([text], chunk_tokens, overlap_tokens, dedup))
+
+
+def shingles(text, size=DEDUP_SHINGLE_CHARS):
+    """CRC32 hashes of the `size`-character n-grams of `text` lowercased to letters and digits."""
+    normalized = _NON_ALNUM_RE.sub("", text.lower()).encode("utf-8")
+    if len(normalized) <= size:
+        return {zlib.crc32(normalized)} if normalized else set()
+    return {zlib.crc32(normalized[i:i + size]) for i in range(len(normalized) - size + 1)}
+
+
+class NearDuplicateFilter:
+    """Drops chunks that largely repeat chunks already kept.
+
+    A chunk is a duplicate when at least `threshold` of its shingles
+    appear in the last DEDUP_WINDOW kept chunks (catches OCR text echoing the
+    page's text layer, however the two are cut), or when its MinHash
+    signature estimates a Jaccard similarity of at least `threshold` with any
+    kept chunk (catches boilerplate repeated across the document). Hashing is
+    seeded, so the same input always yields the same chunks.
+    """
+
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, window=DEDUP_WINDOW,
+                 permutations=MINHASH_PERMUTATIONS, bands=MINHASH_BANDS):
+        self.threshold = threshold
+        self.window = window
+        self.bands = bands
+        self.rows = permutations // bands
+        rng = np.random.default_rng(0)
+        self._a = rng.integers(1, 1 << 31, size=permutations, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=permutations, dtype=np.uint64)
+        self._recent = deque()  # shingle sets of recently kept chunks
+        self._recent_counts = {}  # shingle -> number of recent chunks containing it
+        self._buckets = {}  # (band, band bytes) -> signatures of kept chunks
+        self.kept = 0
+        self.dropped = 0
+
+    def signature(self, hashes):
+        values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        return ((values[:, None] * self._a + self._b) % self._PRIME).min(axis=0)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def is_duplicate(self, text):
+        """Checks `text` against kept chunks and remembers it when it is kept."""
+        if self.threshold <= 0:
+            self.kept += 1
+            return False
+        hashes = shingles(text)
+        if not hashes:
+            self.kept += 1
+            return False
+
+        covered = sum(1 for h in hashes if h in self._recent_counts)
+        duplicate = covered >= self.threshold * len(hashes)
+        signature = self.signature(hashes)
+        if not duplicate:
+            seen = set()
+            for key in self._band_keys(signature):
+                for candidate in self._buckets.get(key, ()):
+                    if id(candidate) not in seen:
+                        seen.add(id(candidate))
+                        if np.mean(candidate == signature) >= self.threshold:
+                            duplicate = True
+                            break
+                if duplicate:
+                    break
+        if duplicate:
+            self.dropped += 1
+            return True
+
+        self.kept += 1
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(signature)
+        self._recent.append(hashes)
+        for h in hashes:
+            self._recent_counts[h] = self._recent_counts.get(h, 0) + 1
+        if len(self._recent) > self.window:
+            for h in self._recent.popleft():
+                if self._recent_counts[h] == 1:
+                    del self._recent_counts[h]
+                else:
+                    self._recent_counts[h] -= 1
+        return False
+
+    def stats(self):
+        return {"kept": self.kept, "dropped": self.dropped}
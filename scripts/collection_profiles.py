@@ -0,0 +1,106 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Profile used by ingest_structured.py when --profile isn't given
+COLLECTION_PROFILE = os.getenv("COLLECTION_PROFILE", "default")
+
+# Collection metadata key recording the profile a collection was created with
+PROFILE_METADATA_KEY = "tuning_profile"
+
+# Named Qdrant tuning profiles, applied when a collection is created.
+#   hnsw:         HNSW graph parameters (m, ef_construct, on_disk)
+#   quantization: None, "int8" (scalar, ~4x less vector RAM) or "binary" (~32x)
+#   on_disk:      keep original vectors on disk (quantized copies stay in RAM)
+#   on_disk_payload: keep payloads on disk
+#   optimizers:   segment optimizer settings
+#   search:       query-time hnsw_ef and quantization rescoring
+PROFILES = {
+    "default": {
+        "hnsw": None,
+        "quantization": None,
+        "on_disk": False,
+        "on_disk_payload": False,
+        "optimizers": None,
+        "search": None,
+    },
+    # Everything in RAM, denser graph, int8 vectors rescored with the originals
+    "low-latency": {
+        "hnsw": {"m": 32, "ef_construct": 256},
+        "quantization": "int8",
+        "on_disk": False,
+        "on_disk_payload": False,
+        "optimizers": {"default_segment_number": 2},
+        "search": {"hnsw_ef": 128, "rescore": True, "oversampling": 1.5},
+    },
+    # int8 vectors in RAM, originals, graph and payloads on disk
+    "low-memory": {
+        "hnsw": {"m": 16, "ef_construct": 100, "on_disk": True},
+        "quantization": "int8",
+        "on_disk": True,
+        "on_disk_payload": True,
+        "optimizers": {"memmap_threshold": 20000},
+        "search": {"hnsw_ef": 64, "rescore": True, "oversampling": 2.0},
+    },
+    # Binary quantization for millions of chunks; rescoring restores precision
+    "large-corpus": {
+        "hnsw": {"m": 32, "ef_construct": 200},
+        "quantization": "binary",
+        "on_disk": True,
+        "on_disk_payload": True,
+        "optimizers": {"memmap_threshold": 20000, "indexing_threshold": 20000},
+        "search": {"hnsw_ef": 128, "rescore": True, "oversampling": 3.0},
+    },
+}
+
+
+def get_profile(name):
+    if name not in PROFILES:
+        raise ValueError(f"Unknown collection profile: {name} (expected one of {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+
+def collection_config(name):
+    """Keyword arguments for QdrantClient.create_collection (besides vectors_config)."""
+    from qdrant_client import models
+    profile = get_profile(name)
+    config = {"on_disk": profile["on_disk"], "on_disk_payload": profile["on_disk_payload"]}
+    if profile["hnsw"]:
+        config["hnsw_config"] = models.HnswConfigDiff(**profile["hnsw"])
+    if profile["optimizers"]:
+        config["optimizers_config"] = models.OptimizersConfigDiff(**profile["optimizers"])
+    if profile["quantization"] == "int8":
+        config["quantization_config"] = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    elif profile["quantization"] == "binary":
+        config["quantization_config"] = models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    return config
+
+
+def search_params(name):
+    """Query-time SearchParams for collections created with profile `name`, or None."""
+    from qdrant_client import models
+    search = PROFILES.get(name, PROFILES["default"])["search"]
+    if not search:
+        return None
+    return models.SearchParams(
+        hnsw_ef=search["hnsw_ef"],
+        quantization=models.QuantizationSearchParams(
+            rescore=search["rescore"], oversampling=search["oversampling"]
+        ),
+    )
+
+
+def describe(name):
+    profile = get_profile(name)
+    parts = [f"quantization={profile['quantization'] or 'none'}"]
+    if profile["hnsw"]:
+        parts.append(f"hnsw m={profile['hnsw']['m']} ef_construct={profile['hnsw']['ef_construct']}")
+    parts.append(f"vectors on_disk={profile['on_disk']}")
+    parts.append(f"payload on_disk={profile['on_disk_payload']}")
+    return f"{name} ({', '.join(parts)})"
@@ -0,0 +1,148 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+from chunking import estimate_tokens
+
+# Load environment variables
+load_dotenv()
+
+# Candidates fetched (with vectors) for MMR reranking; <= the result limit turns MMR off
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+# MMR trade-off: 1 ranks by relevance only, lower values favour chunks unlike those already picked
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Estimated tokens of retrieved chunk text allowed into the prompt (0 = unlimited)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "400"))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def mmr(query_vector, vectors, k, lambda_=MMR_LAMBDA):
+    """Indices of `k` rows of `vectors` picked by Maximal Marginal Relevance, in pick order.
+
+    Each step picks the row maximizing lambda * sim(query, row) - (1 - lambda) *
+    max sim(row, picked rows). Similarities come from two matrix products up
+    front; each step is then one vectorized update over all candidates.
+    """
+    matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+    relevance = matrix @ _normalize(np.asarray(query_vector, dtype=np.float32))
+    similarity = matrix @ matrix.T
+    k = min(k, len(matrix))
+    picked = []
+    max_similarity = np.full(len(matrix), -np.inf, dtype=np.float32)
+    available = np.ones(len(matrix), dtype=bool)
+    for _ in range(k):
+        if picked:
+            scores = lambda_ * relevance - (1 - lambda_) * max_similarity
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return picked
+
+
+def overlap_length(first, second):
+    """Characters at the start of `second` that repeat the end of `first` (whole words, 0 if none)."""
+    start = max(0, len(first) - len(second))
+    for i in range(start, len(first)):
+        # Only whole-word overlaps: chunk overlap is made of trailing sentences
+        if (i == 0 or first[i - 1] == " ") and second.startswith(first[i:]) and second[len(first) - i:][:1] in ("", " "):
+            return len(first) - i
+    return 0
+
+
+def _position(hit):
+    """(document, chunk_index) of a hit: attachments carry a file_key, ingested chunks a source."""
+    return hit.get("file_key") or hit["source"], hit["chunk_index"]
+
+
+def merge_adjacent(hits):
+    """Merges hits that are consecutive, overlapping chunks of the same document into one hit.
+
+    Neighbours only merge when the text of one actually continues the other,
+    so a chunk_index left stale by an earlier ingest can't join unrelated
+    chunks. When two hits share a position the best-ranked one owns it and the
+    other is kept as it is. The merged hit takes the rank of its best-ranked
+    member, the highest score and the id/chunk_index of its first chunk.
+    """
+    positions = {}
+    for i, hit in enumerate(hits):
+        if hit.get("chunk_index") is not None:
+            positions.setdefault(_position(hit), i)
+    merged, consumed = [], set()
+    for i, hit in enumerate(hits):
+        if i in consumed:
+            continue
+        consumed.add(i)
+        run = [hit]
+        if hit.get("chunk_index") is not None and positions[_position(hit)] == i:
+            document, first = _position(hit)
+            last = first
+            while True:
+                j = positions.get((document, first - 1))
+                if j is None or j in consumed or not overlap_length(hits[j]["text"], run[0]["text"]):
+                    break
+                run.insert(0, hits[j])
+                consumed.add(j)
+                first -= 1
+            while True:
+                j = positions.get((document, last + 1))
+                if j is None or j in consumed or not overlap_length(run[-1]["text"], hits[j]["text"]):
+                    break
+                run.append(hits[j])
+                consumed.add(j)
+                last += 1
+        text = run[0]["text"]
+        for neighbour in run[1:]:
+            text += neighbour["text"][overlap_length(text, neighbour["text"]):]
+        merged.append(dict(run[0], text=text, score=max(member["score"] for member in run)))
+    return merged
+
+
+def truncate_tokens(text, max_tokens):
+    """Longest word prefix of `text` within `max_tokens` estimated tokens."""
+    words, used = [], 0
+    for word in text.split(" "):
+        tokens = estimate_tokens(word)
+        if used + tokens > max_tokens:
+            break
+        words.append(word)
+        used += tokens
+    return " ".join(words)
+
+
+def pack(hits, budget=CONTEXT_TOKEN_BUDGET):
+    """Keeps hits, in rank order, while their text fits in `budget` tokens.
+
+    Hits that don't fit are skipped so smaller, lower-ranked ones can still be
+    used; the top hit is truncated rather than dropped.
+    """
+    if budget <= 0:
+        return hits
+    packed, used = [], 0
+    for hit in hits:
+        tokens = estimate_tokens(hit["text"])
+        if used + tokens <= budget:
+            packed.append(hit)
+            used += tokens
+        elif not packed:
+            packed.append(dict(hit, text=truncate_tokens(hit["text"], budget)))
+            used = budget
+    return packed
+
+
+def select(query_vector, hits, limit, lambda_=MMR_LAMBDA, budget=CONTEXT_TOKEN_BUDGET):
+    """Turns search hits into prompt context: MMR down to `limit`, merge neighbours, pack into `budget`.
+
+    MMR runs when there are more hits than `limit` (they then need a "vector");
+    vectors are dropped from the returned hits.
+    """
+    if len(hits) > limit:
+        hits = [hits[i] for i in mmr(query_vector, [hit["vector"] for hit in hits], limit, lambda_)]
+    hits = [{key: value for key, value in hit.items() if key != "vector"} for hit in hits]
+    return pack(merge_adjacent(hits), budget)
@@ -0,0 +1,55 @@
+import os
+import json
+import uuid
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Marker file mapping collection name -> version id. ingest_structured.py bumps the
+# version whenever it rewrites a collection, and caches built on top of the
+# collection (e.g. the backend's response cache) compare against it.
+CORPUS_VERSION_FILE = os.getenv(
+    "CORPUS_VERSION_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", ".corpus_versions.json"),
+)
+
+_lock = threading.Lock()
+_memo = {"mtime": None, "versions": {}}
+
+
+def _read_versions():
+    try:
+        mtime = os.path.getmtime(CORPUS_VERSION_FILE)
+    except OSError:
+        return {}
+    # Only re-read the file when it changed; a stat per lookup is cheap
+    if mtime != _memo["mtime"]:
+        try:
+            with open(CORPUS_VERSION_FILE, "r", encoding="utf-8") as f:
+                versions = json.load(f)
+        except (OSError, ValueError):
+            versions = {}
+        _memo["mtime"] = mtime
+        _memo["versions"] = versions
+    return _memo["versions"]
+
+
+def get_version(collection_name):
+    """Returns the current version id for the collection ("0" if never recorded)."""
+    with _lock:
+        return _read_versions().get(collection_name, "0")
+
+
+def bump_version(collection_name):
+    """Records a new version id for the collection and returns it."""
+    with _lock:
+        versions = dict(_read_versions())
+        versions[collection_name] = uuid.uuid4().hex
+        tmp_path = CORPUS_VERSION_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(versions, f, indent=2)
+        os.replace(tmp_path, CORPUS_VERSION_FILE)
+        _memo["mtime"] = None
+        return versions[collection_name]
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))  # seconds, 0 disables expiry
+# Optional SQLite file for a persistent tier that survives restarts (unset = memory only)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+
+
+def normalize_text(text):
+    """Collapses whitespace and case so trivially different queries share an entry."""
+    return " ".join(text.split()).casefold()
+
+
+def make_key(text, model, task_type):
+    raw = f"{model}\x1f{task_type}\x1f{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SQLiteEmbeddingStore:
+    """Persistent tier: one row per cache key holding the JSON-encoded vector."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, vector, created_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(vector), created_at),
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+
+class EmbeddingCache:
+    """In-process LRU of embeddings with TTL, backed by an optional persistent store.
+
+    Keys combine the normalized text, embedding model and task_type, so query and
+    document embeddings of the same string never collide.
+    """
+
+    def __init__(self, max_size=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL, store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+
+    def _expired(self, created_at):
+        return self.ttl > 0 and (time.time() - created_at) > self.ttl
+
+    def _remember(self, key, vector, created_at):
+        self._entries[key] = (vector, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, created_at = entry
+                if not self._expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+        return None
+
+    def _get_stored(self, key):
+        """Looks `key` up in the persistent store (blocking) and promotes a hit to memory."""
+        stored = self.store.get(key)
+        if stored is None:
+            return None
+        vector, created_at = stored
+        if self._expired(created_at):
+            self.store.delete(key)
+            return None
+        with self._lock:
+            self._remember(key, vector, created_at)
+            self.hits += 1
+            self.persistent_hits += 1
+        return vector
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def get(self, text, model, task_type):
+        key = make_key(text, model, task_type)
+        vector = self._get_memory(key)
+        if vector is None and self.store is not None:
+            vector = self._get_stored(key)
+        if vector is None:
+            self._count_miss()
+        return vector
+
+    async def get_async(self, text, model, task_type):
+        """Like get, but the persistent store is read in a worker thread."""
+        key = make_key(text, model, task_type)
+        vector = self._get_memory(key)
+        if vector is None and self.store is not None:
+            vector = await asyncio.to_thread(self._get_stored, key)
+        if vector is None:
+            self._count_miss()
+        return vector
+
+    def _set_memory(self, text, model, task_type, vector):
+        key = make_key(text, model, task_type)
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, vector, created_at)
+        return key, created_at
+
+    def _persist(self, key, vector, created_at):
+        try:
+            self.store.set(key, vector, created_at)
+        except Exception as e:
+            print(f"Warning: failed to persist embedding: {e}")
+
+    def set(self, text, model, task_type, vector):
+        key, created_at = self._set_memory(text, model, task_type, vector)
+        if self.store is not None:
+            self._persist(key, vector, created_at)
+
+    async def set_async(self, text, model, task_type, vector):
+        """Like set, but the persistent store is written in a worker thread."""
+        key, created_at = self._set_memory(text, model, task_type, vector)
+        if self.store is not None:
+            await asyncio.to_thread(self._persist, key, vector, created_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "persistent_hits": self.persistent_hits,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
+def cached_embedding(cache, text, model, task_type, compute):
+    """Returns the cached vector for (text, model, task_type) or computes and stores it."""
+    vector = cache.get(text, model, task_type)
+    if vector is None:
+        vector = compute(text)
+        if vector:
+            cache.set(text, model, task_type, vector)
+    return vector
+
+
+async def cached_embedding_async(cache, text, model, task_type, compute):
+    """Async counterpart of cached_embedding; `compute` is a coroutine function.
+
+    The in-memory LRU is checked inline; the persistent tier, if any, is read
+    and written in a worker thread so SQLite never blocks the event loop.
+    """
+    vector = await cache.get_async(text, model, task_type)
+    if vector is None:
+        vector = await compute(text)
+        if vector:
+            await cache.set_async(text, model, task_type, vector)
+    return vector
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """Process-wide cache shared by retrieve.py, evaluate.py and the backend."""
+    global _default_cache
+    if _default_cache is None:
+        store = SQLiteEmbeddingStore(EMBEDDING_CACHE_PATH) if EMBEDDING_CACHE_PATH else None
+        _default_cache = EmbeddingCache(store=store)
+    return _default_cache
@@ -0,0 +1,207 @@
+import os
+import re
+import math
+import asyncio
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini")  # gemini | local | fake
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/gemini-embedding-001")
+EMBEDDING_LOCAL_MODEL = os.getenv("EMBEDDING_LOCAL_MODEL", "sentence-transformers/all-mpnet-base-v2")
+# Output dimensionality; gemini-embedding-001 is Matryoshka-trained, so any prefix
+# of its 3072-d output is a usable embedding once renormalized
+VECTOR_SIZE = int(os.getenv("VECTOR_SIZE", "768"))
+
+# Collection metadata key recording which provider produced the stored vectors
+PROVIDER_METADATA_KEY = "embedding_provider"
+
+
+def reduce_dimension(vector, dimension):
+    """Matryoshka reduction: keeps the first `dimension` values and L2-renormalizes.
+
+    Truncation alone leaves vectors with norms below 1, which skews dot-product
+    scores; renormalizing keeps prefixes comparable across texts.
+    """
+    prefix = [float(v) for v in vector[:dimension]]
+    norm = math.sqrt(sum(v * v for v in prefix))
+    if norm > 0:
+        prefix = [v / norm for v in prefix]
+    return prefix
+
+
+class EmbeddingProvider:
+    """Turns texts into vectors. `signature` identifies the vector space."""
+
+    name = "base"
+
+    def __init__(self, model, dimension):
+        self.model = model
+        self.dimension = dimension
+
+    @property
+    def signature(self):
+        return f"{self.name}:{self.model}:{self.dimension}"
+
+    def embed(self, texts, task_type):
+        raise NotImplementedError
+
+    async def aembed(self, texts, task_type):
+        return await asyncio.to_thread(self.embed, texts, task_type)
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    name = "gemini"
+
+    def __init__(self, model=EMBEDDING_MODEL, dimension=VECTOR_SIZE):
+        super().__init__(model, dimension)
+        import google.generativeai as genai
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY is missing in .env file.")
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.native_dimensionality = True  # request output_dimensionality from the API
+
+    def _request(self, texts, task_type):
+        request = {"model": self.model, "content": list(texts), "task_type": task_type}
+        if self.native_dimensionality:
+            request["output_dimensionality"] = self.dimension
+        return request
+
+    def _fallback(self, e):
+        """Older SDKs lack output_dimensionality: truncate client-side instead."""
+        if not self.native_dimensionality or "output_dimensionality" not in str(e):
+            raise e
+        print("Warning: output_dimensionality unsupported by this SDK; truncating embeddings client-side.")
+        self.native_dimensionality = False
+
+    def _reduce(self, embeddings):
+        # Reduced-size outputs aren't unit-length, whether the API or we truncate
+        return [reduce_dimension(e, self.dimension) for e in embeddings]
+
+    def embed(self, texts, task_type):
+        try:
+            result = self.genai.embed_content(**self._request(texts, task_type))
+        except TypeError as e:
+            self._fallback(e)
+            result = self.genai.embed_content(**self._request(texts, task_type))
+        return self._reduce(result['embedding'])
+
+    async def aembed(self, texts, task_type):
+        try:
+            result = await self.genai.embed_content_async(**self._request(texts, task_type))
+        except TypeError as e:
+            self._fallback(e)
+            result = await self.genai.embed_content_async(**self._request(texts, task_type))
+        return self._reduce(result['embedding'])
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """CPU embeddings via sentence-transformers; no network round-trip per query."""
+
+    name = "local"
+
+    def __init__(self, model=EMBEDDING_LOCAL_MODEL):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_PROVIDER=local requires sentence-transformers (pip install sentence-transformers)"
+            ) from e
+        self._model = SentenceTransformer(model, device="cpu")
+        super().__init__(model, self._model.get_sentence_embedding_dimension())
+
+    def embed(self, texts, task_type):
+        vectors = self._model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True)
+        return [v.tolist() for v in vectors]
+
+
+class HashEmbeddingProvider(EmbeddingProvider):
+    """Deterministic offline embeddings for tests and benchmarks.
+
+    Word unigrams and character trigrams are feature-hashed into signed
+    buckets and L2-normalized, so texts sharing vocabulary land close together.
+    The same text always yields the same vector, on any machine.
+    """
+
+    name = "fake"
+
+    def __init__(self, dimension=VECTOR_SIZE):
+        super().__init__("feature-hash-v1", dimension)
+
+    def _features(self, text):
+        words = re.findall(r"\w+", text.lower())
+        yield from words
+        for word in words:
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3]
+
+    def _embed_one(self, text):
+        vector = [0.0] * self.dimension
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        norm = math.sqrt(sum(v * v for v in vector))
+        if norm > 0:
+            vector = [v / norm for v in vector]
+        return vector
+
+    def embed(self, texts, task_type):
+        return [self._embed_one(text) for text in texts]
+
+    async def aembed(self, texts, task_type):
+        return self.embed(texts, task_type)
+
+
+PROVIDERS = {
+    "gemini": GeminiEmbeddingProvider,
+    "local": LocalEmbeddingProvider,
+    "fake": HashEmbeddingProvider,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def create_provider(name):
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider: {name} (expected one of {', '.join(PROVIDERS)})")
+    return PROVIDERS[name]()
+
+
+def get_provider():
+    """Returns the configured provider (EMBEDDING_PROVIDER), created once per process."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = create_provider(EMBEDDING_PROVIDER)
+    return _provider
+
+
+def provider_metadata(provider):
+    """Collection metadata recording which provider produced its vectors."""
+    return {PROVIDER_METADATA_KEY: provider.signature}
+
+
+def check_collection_provider(metadata, collection_name, provider):
+    """Raises if the collection's vectors were produced by a different provider.
+
+    `metadata` is the collection metadata from VectorStore.collection_metadata.
+    """
+    stored = (metadata or {}).get(PROVIDER_METADATA_KEY)
+    if stored is None:
+        print(f"Warning: {collection_name} has no recorded embedding provider; assuming {provider.signature}")
+        return
+    if stored != provider.signature:
+        raise ValueError(
+            f"Collection {collection_name} holds {stored} vectors but the configured provider is "
+            f"{provider.signature}; re-ingest with --recreate or change EMBEDDING_PROVIDER."
+        )
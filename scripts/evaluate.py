@@ -1,29 +1,33 @@
-import os
-import google.generativeai as genai
-from qdrant_client import QdrantClient
+import json
+import time
+import argparse
+import itertools
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import embedding_cache
+import embeddings
+import vector_store
+import collection_profiles
+import context_packing
+from chunking import iter_chunks, estimate_tokens, NearDuplicateFilter, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, DEDUP_THRESHOLD
+from ingest_manifest import content_hash, chunk_point_id
+from latency_stats import latency_stats
 
 # Load environment variables
 load_dotenv()
 
-# Configuration
-QDRANT_URL = os.getenv("QDRANT_URL")
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Collection Configuration
+COLLECTION_NAME = "ai_structured_collection_v2"
 
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY is missing in .env file.")
+# Embedding backend selected by EMBEDDING_PROVIDER (see embeddings.py)
+provider = embeddings.get_provider()
 
-# Initialize Gemini
-genai.configure(api_key=GOOGLE_API_KEY)
+# Shared query-embedding cache (see embedding_cache.py)
+query_cache = embedding_cache.get_default_cache()
 
-# Initialize Qdrant Client
-client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=60)
-
-# Collection Configuration
-COLLECTION_NAME = "ai_structured_collection_v2"
-EMBEDDING_MODEL = "models/gemini-embedding-001"
-VECTOR_SIZE = 768
+# Chunks per embedding call when building benchmark collections
+BENCH_EMBED_BATCH = 100
 
 # --- Golden Dataset ---
 # A list of queries and expected keywords that MUST be present in the retrieved chunks/source.
@@ -52,80 +56,221 @@ TEST_DATASET = [
     }
 ]
 
+def _embed_query(text):
+    return provider.embed([text], "retrieval_query")[0]
+
 def get_embedding(text):
-    """Generates embedding for the given text using Gemini API."""
-    result = genai.embed_content(
-        model=EMBEDDING_MODEL,
-        content=text,
-        task_type="retrieval_query",
-    )
-    embedding = result['embedding']
-    if len(embedding) > VECTOR_SIZE:
-        embedding = embedding[:VECTOR_SIZE]
-    return embedding
+    """Generates the query embedding with the configured provider (cached)."""
+    return embedding_cache.cached_embedding(query_cache, text, provider.signature, "retrieval_query", _embed_query)
 
-def evaluate(k=3):
-    """Evaluates retrieval accuracy (Hit Rate & MRR) @ K."""
-    print(f"Evaluating Retrieval Accuracy @ {k}...\n")
-    
-    total_hits = 0
-    total_reciprocal_rank = 0
-    total_queries = len(TEST_DATASET)
-
-    for case in TEST_DATASET:
-        query = case["query"]
-        expected = case["expected_keywords"]
-        print(f"Query: '{query}'")
-        
-        # 1. Retrieve
-        try:
-            query_vector = get_embedding(query)
-            search_result = client.query_points(
-                collection_name=COLLECTION_NAME,
-                query=query_vector,
-                limit=k
-            )
-            hits = search_result.points
-        except Exception as e:
-            print(f"  Error retrieving: {e}")
-            continue
-
-        # 2. Check for Hits
-        hit_rank = 0 # 0 means no hit
-        found_keywords = []
-
-        for i, hit in enumerate(hits):
-            text = hit.payload.get('text', '').lower()
-            # Check if ANY expected keyword is in the retrieved text
-            matched = [kw for kw in expected if kw.lower() in text]
-            
-            if matched:
-                if hit_rank == 0:
-                    hit_rank = i + 1 # 1-indexed rank
-                found_keywords.extend(matched)
-                # We count the first relevant result for MRR
-                break 
-        
-        # 3. Update Metrics
-        if hit_rank > 0:
-            total_hits += 1
-            total_reciprocal_rank += 1.0 / hit_rank
-            print(f"  [HIT] Rank: {hit_rank} (Matched: {found_keywords})")
+def load_queries(path):
+    """Loads a query set: a JSON list or JSONL of {"query", "expected_keywords"} objects."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            queries = [json.loads(line) for line in f if line.strip()]
         else:
-            print(f"  [MISS] Expected: {expected}")
-        
-        print("-" * 30)
+            queries = json.load(f)
+    for case in queries:
+        if "query" not in case:
+            raise ValueError(f"{path}: every entry needs a 'query' field")
+        case.setdefault("expected_keywords", [])
+    return queries
+
+def hit_rank(hits, expected):
+    """1-based rank of the first hit containing any expected keyword (0 = miss)."""
+    for i, hit in enumerate(hits):
+        text = hit['text'].lower()
+        if any(kw.lower() in text for kw in expected):
+            return i + 1
+    return 0
+
+def run_query(collection, case, k, use_cache, two_stage, pack_context=False):
+    """Embeds and searches one query, timing each stage.
+
+    With `pack_context` the hits are what the backend puts in the prompt:
+    over-fetched, MMR-reranked, merged and packed (see context_packing.py).
+    """
+    store = vector_store.get_store()
+    start = time.perf_counter()
+    if use_cache:
+        query_vector = get_embedding(case["query"])
+    else:
+        query_vector = _embed_query(case["query"])
+    embedded = time.perf_counter()
+    if pack_context:
+        fetch = max(k, context_packing.RETRIEVAL_CANDIDATES)
+        hits = store.search(collection, query_vector, fetch, with_vectors=fetch > k)
+        hits = context_packing.select(query_vector, hits, k)
+    else:
+        hits = store.search(collection, query_vector, k)
+    searched = time.perf_counter()
+
+    record = {
+        "embed": embedded - start,
+        "search": searched - embedded,
+        "total": searched - start,
+        "rank": hit_rank(hits, case["expected_keywords"]),
+        "context_tokens": sum(estimate_tokens(hit["text"]) for hit in hits),
+    }
+    if two_stage and not pack_context:
+        # Share of the exact top-k the two-stage search also returned (not timed)
+        exact_ids = {hit["id"] for hit in store.search(collection, query_vector, k, exact=True)}
+        record["recall"] = len(exact_ids.intersection(hit["id"] for hit in hits)) / max(1, len(exact_ids))
+    return record
+
+def benchmark(collection, queries, k=3, concurrency=1, repeat=1, use_cache=False, pack_context=False):
+    """Runs `queries` (`repeat` times) with `concurrency` threads and summarizes the results."""
+    store = vector_store.get_store()
+    two_stage = bool(store.collection_metadata(collection).get(vector_store.PREFIX_METADATA_KEY)) and not pack_context
+    workload = [case for _ in range(repeat) for case in queries]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        records = list(pool.map(lambda case: run_query(collection, case, k, use_cache, two_stage, pack_context), workload))
+    wall = time.perf_counter() - start
+
+    ranks = [r["rank"] for r in records]
+    result = {
+        "collection": collection,
+        "k": k,
+        "concurrency": concurrency,
+        "packed_context": pack_context,
+        "queries": len(records),
+        "hit_rate": round(sum(1 for r in ranks if r) / len(ranks), 4),
+        "mrr": round(sum(1.0 / r for r in ranks if r) / len(ranks), 4),
+        "qps": round(len(records) / wall, 2),
+        "context_tokens_mean": round(sum(r["context_tokens"] for r in records) / len(records), 1),
+        "latency_ms": {stage: latency_stats([r[stage] for r in records]) for stage in ("embed", "search", "total")},
+    }
+    if two_stage:
+        result["two_stage_recall"] = round(sum(r["recall"] for r in records) / len(records), 4)
+    return result
+
+def read_corpus(path, use_ocr=False):
+    """Yields the text of a PDF (page by page) or a plain-text file."""
+    if path.lower().endswith(".pdf"):
+        from pdf_pages import iter_page_texts
+        yield from iter_page_texts(path, use_ocr=use_ocr)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield f.read()
+
+def build_collection(corpus, chunk_tokens, overlap_tokens, profile, prefix_dim=0, use_ocr=False, dedup_threshold=DEDUP_THRESHOLD):
+    """(Re)creates a benchmark collection from `corpus` with the given chunking, dedup and profile."""
+    store = vector_store.get_store()
+    name = f"{COLLECTION_NAME}_bench_c{chunk_tokens}_o{overlap_tokens}_d{dedup_threshold:g}_{profile}"
+    if store.collection_exists(name):
+        store.delete_collection(name)
+    store.create_collection(name, provider.dimension, embeddings.provider_metadata(provider),
+                            profile=profile, prefix_dim=prefix_dim)
+
+    start = time.perf_counter()
+    count = 0
+    batch = []
+
+    def flush():
+        vectors = provider.embed(batch, "retrieval_document")
+        ids = [chunk_point_id(corpus, content_hash(text)) for text in batch]
+        first = count - len(batch)
+        store.upsert(name, ids, vectors, [{"text": text, "source": corpus, "chunk_index": first + i} for i, text in enumerate(batch)])
+
+    dedup = NearDuplicateFilter(dedup_threshold)
+    for text in iter_chunks(read_corpus(corpus, use_ocr), chunk_tokens, overlap_tokens, dedup):
+        batch.append(text)
+        count += 1
+        if len(batch) >= BENCH_EMBED_BATCH:
+            flush()
+            batch = []
+    if batch:
+        flush()
+    build_seconds = time.perf_counter() - start
+    print(f"Built {name}: {count} chunks ({dedup.dropped} near-duplicates dropped) in {build_seconds:.2f}s")
+    return name, {"chunks": count, "dedup_dropped": dedup.dropped, "build_seconds": round(build_seconds, 3)}
+
+def print_result(result):
+    total = result["latency_ms"]["total"]
+    line = (f"{result['collection']} k={result['k']} c={result['concurrency']}: "
+            f"hit_rate={result['hit_rate']:.2%} mrr={result['mrr']:.4f} qps={result['qps']:.1f} "
+            f"context={result['context_tokens_mean']:.0f} tok "
+            f"total p50/p95/p99={total['p50']:.1f}/{total['p95']:.1f}/{total['p99']:.1f} ms "
+            f"(embed p50 {result['latency_ms']['embed']['p50']:.1f}, search p50 {result['latency_ms']['search']['p50']:.1f})")
+    if "two_stage_recall" in result:
+        line += f" two-stage recall={result['two_stage_recall']:.2%}"
+    print(line)
+
+def evaluate(k=3):
+    """Evaluates retrieval accuracy (Hit Rate & MRR) @ K on the golden dataset."""
+    store = vector_store.get_store()
+    print(f"Evaluating Retrieval Accuracy @ {k} ({provider.signature})...\n")
+    embeddings.check_collection_provider(store.collection_metadata(COLLECTION_NAME), COLLECTION_NAME, provider)
+    result = benchmark(COLLECTION_NAME, TEST_DATASET, k=k, use_cache=True)
+    print_result(result)
+    print(f"Embedding cache: {query_cache.stats()}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency benchmark")
+    parser.add_argument("--queries", help="Query set (.json list or .jsonl of {query, expected_keywords}); default: built-in golden set")
+    parser.add_argument("-k", "--k", type=int, nargs="+", default=[3], help="Result counts to sweep")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1], help="Concurrent query threads to sweep")
+    parser.add_argument("--repeat", type=int, default=1, help="Times each query set is replayed per run")
+    parser.add_argument("--cache", action="store_true", help="Use the query-embedding cache (default: embed every query)")
+    parser.add_argument("--packed", action="store_true",
+                        help="Score the MMR-reranked, merged and budget-packed prompt context instead of the raw top-k")
+    parser.add_argument("--corpus", help="PDF or text file to build benchmark collections from; default: query the ingested collection")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[CHUNK_TOKENS], help="Chunk sizes in tokens to sweep (with --corpus)")
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[CHUNK_OVERLAP_TOKENS], help="Chunk overlaps in tokens to sweep (with --corpus)")
+    parser.add_argument("--dedup-thresholds", type=float, nargs="+", default=[DEDUP_THRESHOLD],
+                        help="Near-duplicate thresholds to sweep, 0 = keep every chunk (with --corpus)")
+    parser.add_argument("--profiles", nargs="+", default=["default"], choices=list(collection_profiles.PROFILES),
+                        help="Collection tuning profiles to sweep (with --corpus)")
+    parser.add_argument("--prefix-dim", type=int, default=vector_store.PREFIX_DIM, help="Two-stage prefix size for benchmark collections")
+    parser.add_argument("--ocr", action="store_true", help="OCR image-only PDF pages while building collections")
+    parser.add_argument("--keep", action="store_true", help="Keep benchmark collections afterwards")
+    parser.add_argument("--output", help="Write a JSON report to this path")
+    args = parser.parse_args()
+    store = vector_store.get_store()
+
+    queries = load_queries(args.queries) if args.queries else TEST_DATASET
+    print(f"Benchmarking {len(queries)} queries with {provider.signature} on {vector_store.VECTOR_STORE}")
+
+    if args.corpus:
+        builds = []
+        for chunk_size, overlap, dedup_threshold, profile in itertools.product(
+                args.chunk_sizes, args.overlaps, args.dedup_thresholds, args.profiles):
+            if overlap >= chunk_size:
+                print(f"Skipping chunk size {chunk_size} with overlap {overlap}")
+                continue
+            name, stats = build_collection(args.corpus, chunk_size, overlap, profile, args.prefix_dim, args.ocr, dedup_threshold)
+            builds.append((name, dict(stats, chunk_size=chunk_size, overlap=overlap, dedup_threshold=dedup_threshold, profile=profile)))
+    else:
+        embeddings.check_collection_provider(store.collection_metadata(COLLECTION_NAME), COLLECTION_NAME, provider)
+        builds = [(COLLECTION_NAME, {})]
 
-    # 4. Final Calculation
-    hit_rate = total_hits / total_queries
-    mrr = total_reciprocal_rank / total_queries
+    runs = []
+    try:
+        for name, build in builds:
+            for k, concurrency in itertools.product(args.k, args.concurrency):
+                result = dict(benchmark(name, queries, k, concurrency, args.repeat, args.cache, args.packed), **build)
+                print_result(result)
+                runs.append(result)
+    finally:
+        if args.corpus and not args.keep:
+            for name, _ in builds:
+                store.delete_collection(name)
 
-    print("\n" + "=" * 30)
-    print(f"Final Results (K={k}):")
-    print(f"Queries Evaluated: {total_queries}")
-    print(f"Hit Rate: {hit_rate:.2%}")
-    print(f"MRR:      {mrr:.4f}")
-    print("=" * 30)
+    if args.output:
+        report = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "provider": provider.signature,
+            "vector_store": vector_store.VECTOR_STORE,
+            "queries": args.queries or "builtin",
+            "repeat": args.repeat,
+            "cache": args.cache,
+            "runs": runs,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Report written to {args.output}")
 
 if __name__ == "__main__":
-    evaluate(k=3)
+    main()
@@ -0,0 +1,143 @@
+import os
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Content-addressed store of extracted text (PDF text layers and OCR output),
+# shared by ingest_structured.py and the backend's upload path.
+EXTRACTION_CACHE_DIR = os.getenv(
+    "EXTRACTION_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "extraction"),
+)
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def make_key(data, *settings):
+    """Hash of the input bytes plus every setting that affects the extracted text."""
+    h = hashlib.sha256(data)
+    for setting in settings:
+        h.update(b"\x1f" + repr(setting).encode("utf-8"))
+    return h.hexdigest()
+
+
+def file_digest(path):
+    """sha256 of a file, read in 1 MiB blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ExtractionCache:
+    """Stores text files named by key on local disk, evicting least-recently-used past `max_bytes`.
+
+    Writes are atomic renames, so several processes (e.g. OCR workers) can share
+    one directory. Reads bump the file's mtime, which is what eviction orders by.
+    """
+
+    def __init__(self, directory=EXTRACTION_CACHE_DIR, max_bytes=EXTRACTION_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None  # computed lazily by scanning the directory
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".txt")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path, None)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def set(self, key, text):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: failed to write extraction cache entry: {e}")
+            return
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += os.path.getsize(path)
+            if self._total_bytes is None or self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self):
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            # Trim to 90% so eviction doesn't run on every subsequent write
+            target = self.max_bytes * 0.9
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+        self._total_bytes = total
+
+    def get_or_compute(self, key, compute):
+        """Returns cached text for `key`, or runs `compute()` and stores its result."""
+        text = self.get(key)
+        if text is None:
+            text = compute()
+            if text is not None:
+                self.set(key, text)
+        return text
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """Process-wide cache instance, or None when EXTRACTION_CACHE_ENABLED is off."""
+    global _default_cache
+    if not EXTRACTION_CACHE_ENABLED:
+        return None
+    if _default_cache is None:
+        _default_cache = ExtractionCache()
+    return _default_cache
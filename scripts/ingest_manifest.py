@@ -0,0 +1,60 @@
+import os
+import json
+import uuid
+import hashlib
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Local record of what has already been embedded:
+# {collection_name: {source: {point_id: content_hash}}}
+INGEST_MANIFEST_PATH = os.getenv(
+    "INGEST_MANIFEST_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", ".ingest_manifest.json"),
+)
+
+# Fixed namespace so the same (source, content) always maps to the same point id
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2b1e-4f0a-5d8e-9a57-3c2a9e0b7d41")
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_point_id(source, chunk_hash):
+    """Deterministic Qdrant point id (UUID string) for a chunk of `source`."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\x1f{chunk_hash}"))
+
+
+def load_manifest(path=INGEST_MANIFEST_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        print(f"Warning: ignoring unreadable manifest {path}: {e}")
+        return {}
+
+
+def save_manifest(manifest, path=INGEST_MANIFEST_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def stale_point_ids(manifest, collection_name, source, seen_ids, other_sources_stale=False):
+    """Point ids recorded for `source` that weren't produced by this run.
+
+    With `other_sources_stale`, every point recorded for a different source is
+    also reported stale (used when the collection should mirror one file).
+    """
+    collection = manifest.get(collection_name, {})
+    stale_ids = [point_id for point_id in collection.get(source, {}) if point_id not in seen_ids]
+    if other_sources_stale:
+        for other_source, entries in collection.items():
+            if other_source != source:
+                stale_ids.extend(entries.keys())
+    return stale_ids
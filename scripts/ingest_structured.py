@@ -1,120 +1,178 @@
 import os
 import argparse
-import pdfplumber
-import google.generativeai as genai
-import pytesseract
-from PIL import Image
-from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct
 from dotenv import load_dotenv
+import embeddings
+import vector_store
+import collection_profiles
+import corpus_version
+import metrics
+from ingest_manifest import load_manifest, save_manifest, content_hash, chunk_point_id, stale_point_ids
 import time
 import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import AdaptiveRateLimiter
+from pdf_pages import iter_page_texts, PAGE_TIMEOUT
+from chunking import iter_chunks, estimate_tokens, NearDuplicateFilter, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, DEDUP_THRESHOLD
 
 # Load environment variables
 load_dotenv()
 
-# Configuration
-QDRANT_URL = os.getenv("QDRANT_URL")
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY is missing in .env file.")
+# Collection Configuration
+COLLECTION_NAME = "ai_structured_collection_v2"
 
-# Configure tesseract executable path
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+# Embedding throughput: texts per API call, concurrent calls, and the API quota
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "50"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+EMBED_RPM = int(os.getenv("EMBED_RPM", "1500"))
+EMBED_TPM = int(os.getenv("EMBED_TPM", "1000000"))
 
-# Initialize Gemini
-genai.configure(api_key=GOOGLE_API_KEY)
+# Seconds between manifest saves while ingesting (also saved once at the end); a crash
+# only costs re-embedding the batches recorded since the last save
+MANIFEST_SAVE_SECONDS = float(os.getenv("MANIFEST_SAVE_SECONDS", "10"))
 
-# Initialize Qdrant Client
-client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=60)
+# Processes for page rendering + OCR (defaults to one per core)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
 
-# Collection Configuration
-COLLECTION_NAME = "ai_structured_collection_v2"
-EMBEDDING_MODEL = "models/gemini-embedding-001"
-VECTOR_SIZE = 768 
+def is_rate_limit_error(e):
+    return "429" in str(e) or "Resource exhausted" in str(e)
 
-CHUNK_SIZE = 450
-CHUNK_OVERLAP = 80
+def embed_batch(texts, limiter, retries=5):
+    """Embeds a list of texts in a single API call, governed by `limiter`.
 
-def get_embedding(text, retries=5):
-    """Generates embedding with exponential backoff."""
+    Returns a list of embeddings aligned with `texts` (None for failures).
+    """
+    tokens = sum(estimate_tokens(t) for t in texts)
+    provider = embeddings.get_provider()
     for attempt in range(retries):
+        limiter.acquire(tokens)
         try:
-            result = genai.embed_content(
-                model=EMBEDDING_MODEL,
-                content=text,
-                task_type="retrieval_document"
-            )
-            if 'embedding' in result:
-                embedding = result['embedding']
-                if len(embedding) > VECTOR_SIZE:
-                    embedding = embedding[:VECTOR_SIZE]
-                return embedding
-            else:
-                print(f"Warning: No embedding returned for text: {text[:50]}...")
-                return None
+            with metrics.stage("embed"):
+                vectors = provider.embed(texts, "retrieval_document")
+            limiter.on_success()
+            if len(vectors) != len(texts):
+                print(f"Warning: Got {len(vectors)} embeddings for {len(texts)} texts starting: {texts[0][:50]}...")
+                return [None] * len(texts)
+            return vectors
         except Exception as e:
-            if "429" in str(e) or "Resource exhausted" in str(e):
-                unique_wait = (2 ** attempt) + random.uniform(0, 5)
-                print(f"Rate limit hit. Waiting {unique_wait:.2f}s... (Attempt {attempt+1}/{retries})")
-                time.sleep(unique_wait)
+            if is_rate_limit_error(e):
+                print(f"Rate limit hit (Attempt {attempt+1}/{retries})")
+                limiter.on_rate_limited()
             else:
-                print(f"Error generating embedding: {e}")
-                time.sleep(5)
-    return None
-
-def chunk_text(text, chunk_size, overlap):
-    """Splits text into chunks of `chunk_size` characters with `overlap`."""
-    if not text:
-        return []
-    
-    chunks = []
-    start = 0
-    text_len = len(text)
-    
-    while start < text_len:
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += (chunk_size - overlap)
-    
-    return chunks
-
-def extract_text_and_ocr(pdf_path, use_ocr=True):
-    """Extracts raw text and performs OCR if needed."""
-    full_text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for i, page in enumerate(pdf.pages):
-            print(f"Processing page {i+1}/{len(pdf.pages)}...")
-            
-            # Try direct text extraction
-            text = page.extract_text()
-            if text:
-                full_text += text + "\n"
-            
-            # Check for images or low text count to trigger OCR
-            if use_ocr and (len(page.images) > 0 or (text and len(text) < 100)):
-                print(f"  OCR triggered for page {i+1}...")
-                try:
-                    # Render page to image
-                    with page.to_image(resolution=300) as img:
-                        pil_img = img.original
-                        ocr_text = pytesseract.image_to_string(pil_img)
-                        if ocr_text:
-                            print(f"  OCR extracted {len(ocr_text)} characters.")
-                            full_text += "\n--- OCR Data ---\n" + ocr_text + "\n"
-                except Exception as e:
-                    print(f"  OCR failed for page {i+1}: {e}")
-            
-    return full_text
+                print(f"Error generating embeddings: {e}")
+                time.sleep((2 ** attempt) + random.uniform(0, 1))
+    return [None] * len(texts)
+
+def timed_iter(iterable, stage_name):
+    """Yields from `iterable`, timing each next() as `stage_name`."""
+    iterator = iter(iterable)
+    while True:
+        with metrics.stage(stage_name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+def print_stage_summary():
+    for (stage_name,), (count, total) in sorted(metrics.STAGE_SECONDS.summary().items()):
+        print(f"  {stage_name:<10} {count:>6} calls {total:>9.2f}s total {total / count * 1000:>9.1f} ms avg")
+
+def ingest_stream(store, chunks, source, manifest, limiter, batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS):
+    """Embeds and upserts a stream of chunks into `store` batch by batch.
+
+    Chunks already recorded in the manifest are skipped. At most `2 * workers`
+    embedding batches are in flight, which applies backpressure to page
+    extraction. Each batch is upserted and recorded in the manifest as soon as
+    it is embedded; the manifest is written every MANIFEST_SAVE_SECONDS and
+    once at the end, so a crash only re-embeds batches recorded since the
+    last save (point ids are deterministic, so nothing is duplicated).
+    Returns (counts, seen_ids).
+    """
+    source_manifest = manifest.setdefault(COLLECTION_NAME, {}).setdefault(source, {})
+    seen_ids = set()
+    counts = {"chunks": 0, "embedded": 0, "unchanged": 0, "failed": 0}
+    last_save = time.monotonic()
+
+    def pending_batches():
+        batch = []
+        for idx, text in enumerate(chunks):
+            counts["chunks"] += 1
+            chunk_hash = content_hash(text)
+            point_id = chunk_point_id(source, chunk_hash)
+            if point_id in seen_ids:
+                continue  # identical chunk text already handled for this source
+            seen_ids.add(point_id)
+            if point_id in source_manifest:
+                counts["unchanged"] += 1
+                continue
+            batch.append((point_id, chunk_hash, idx, text))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def flush(batch, vectors):
+        nonlocal last_save
+        ids, kept_vectors, payloads = [], [], []
+        for (point_id, chunk_hash, idx, chunk_text_content), embedding in zip(batch, vectors):
+            if embedding:
+                ids.append(point_id)
+                kept_vectors.append(embedding)
+                payloads.append({"text": chunk_text_content, "source": source, "chunk_index": idx, "content_hash": chunk_hash})
+            else:
+                print(f"Skipping chunk {idx} due to embedding failure.")
+                counts["failed"] += 1
+        if not ids:
+            return
+        try:
+            with metrics.stage("upsert"):
+                store.upsert(COLLECTION_NAME, ids, kept_vectors, payloads)
+        except Exception as e:
+            print(f"Error upserting {len(ids)} points: {e}")
+            counts["failed"] += len(ids)
+            return
+        for point_id, payload in zip(ids, payloads):
+            source_manifest[point_id] = payload["content_hash"]
+        if time.monotonic() - last_save >= MANIFEST_SAVE_SECONDS:
+            save_manifest(manifest)
+            last_save = time.monotonic()
+        counts["embedded"] += len(ids)
+        print(f"Upserted {counts['embedded']} points ({counts['chunks']} chunks read).")
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+            for batch in pending_batches():
+                in_flight.append((batch, pool.submit(embed_batch, [c[3] for c in batch], limiter)))
+                if len(in_flight) >= 2 * workers:
+                    done_batch, future = in_flight.popleft()
+                    flush(done_batch, future.result())
+            while in_flight:
+                done_batch, future = in_flight.popleft()
+                flush(done_batch, future.result())
+    finally:
+        save_manifest(manifest)  # also records finished batches when a batch raises
+
+    return counts, seen_ids
 
 def main():
-    parser = argparse.ArgumentParser(description="Ingest PDF into Qdrant")
+    parser = argparse.ArgumentParser(description="Ingest PDF into the vector store")
     parser.add_argument("pdf_path", nargs="?", default="data/ocr-test-doc.pdf", help="Path to the PDF file")
-    parser.add_argument("--append", action="store_true", help="Append to existing collection instead of recreating it")
+    parser.add_argument("--append", action="store_true", help="Keep other sources in the collection instead of syncing it to this file only")
+    parser.add_argument("--recreate", action="store_true", help="Drop the collection and re-embed everything from scratch")
+    parser.add_argument("--profile", choices=list(collection_profiles.PROFILES), default=collection_profiles.COLLECTION_PROFILE,
+                        help="Collection tuning profile (HNSW, quantization, on-disk storage), applied on creation")
+    parser.add_argument("--prefix-dim", type=int, default=vector_store.PREFIX_DIM,
+                        help="Also index a renormalized N-d prefix of each vector for two-stage search (0 = off)")
     parser.add_argument("--no-ocr", action="store_false", dest="ocr", help="Disable OCR even if images found")
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS, help="Processes used for page rendering and OCR")
+    parser.add_argument("--page-timeout", type=float, default=PAGE_TIMEOUT, help="Seconds allowed for OCR of a single page")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding request")
+    parser.add_argument("--embed-workers", type=int, default=EMBED_WORKERS, help="Concurrent embedding requests")
+    parser.add_argument("--rpm", type=int, default=EMBED_RPM, help="Embedding requests per minute quota")
+    parser.add_argument("--tpm", type=int, default=EMBED_TPM, help="Embedding tokens per minute quota")
     parser.set_defaults(ocr=True)
     args = parser.parse_args()
 
@@ -123,92 +181,109 @@ def main():
         print(f"Error: File not found: {pdf_path}")
         return
 
-    print(f"Processing {pdf_path} (OCR: {args.ocr}) with Chunk Size {CHUNK_SIZE}, Overlap {CHUNK_OVERLAP}...")
-    
-    # 1. Extract & OCR
-    print("Extracting text and performing OCR...")
-    raw_text = extract_text_and_ocr(pdf_path, use_ocr=args.ocr)
-    print(f"Total extracted {len(raw_text)} characters.")
-    
-    if len(raw_text) == 0:
-        print("Error: No text extracted. Aborting.")
-        return
+    print(f"Processing {pdf_path} (OCR: {args.ocr}, workers: {args.workers}) with ~{CHUNK_TOKENS}-token chunks, "
+          f"{CHUNK_OVERLAP_TOKENS}-token overlap, near-duplicate threshold {DEDUP_THRESHOLD}...")
 
-    # 2. Chunk
-    print("Chunking text...")
-    text_chunks = chunk_text(raw_text, CHUNK_SIZE, CHUNK_OVERLAP)
-    print(f"Created {len(text_chunks)} chunks.")
-    
-    # 3. Collection Management
-    exists = client.collection_exists(COLLECTION_NAME)
-    if exists and not args.append:
+    # 1. Collection Management
+    # Vector store selected by VECTOR_STORE (see vector_store.py). Opened here rather than at
+    # import: OCR worker processes started with spawn re-import this module
+    store = vector_store.get_store()
+    manifest = load_manifest()
+    exists = store.collection_exists(COLLECTION_NAME)
+    if exists and (args.recreate or (not args.append and COLLECTION_NAME not in manifest)):
+        # Without a manifest we can't tell which points belong to which file
         print(f"Deleting existing collection: {COLLECTION_NAME}")
-        client.delete_collection(COLLECTION_NAME)
+        store.delete_collection(COLLECTION_NAME)
+        corpus_version.bump_version(COLLECTION_NAME)
         exists = False
 
-    if not exists:
-        print(f"Creating collection: {COLLECTION_NAME} with dimension {VECTOR_SIZE}")
-        client.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE),
+    provider = embeddings.get_provider()
+    if exists:
+        metadata = store.collection_metadata(COLLECTION_NAME)
+        # Never mix vectors from different embedding providers in one collection
+        embeddings.check_collection_provider(metadata, COLLECTION_NAME, provider)
+        profile = metadata.get(collection_profiles.PROFILE_METADATA_KEY, "default")
+        print(f"Collection {COLLECTION_NAME} uses tuning profile: {profile}")
+        if profile != args.profile:
+            print(f"Warning: profile {args.profile} only applies to new collections; use --recreate to switch.")
+    else:
+        manifest[COLLECTION_NAME] = {}
+        print(f"Creating collection: {COLLECTION_NAME} with dimension {provider.dimension} ({provider.signature})")
+        print(f"Tuning profile: {collection_profiles.describe(args.profile)}")
+        if not 0 <= args.prefix_dim < provider.dimension:
+            print(f"Error: --prefix-dim must be between 0 and {provider.dimension - 1}.")
+            return
+        if args.prefix_dim:
+            print(f"Two-stage search: {args.prefix_dim}-d prefix candidates, rescored at {provider.dimension}-d")
+        store.create_collection(
+            COLLECTION_NAME,
+            provider.dimension,
+            embeddings.provider_metadata(provider),
+            profile=args.profile,
+            prefix_dim=args.prefix_dim,
         )
 
-    # 4. Generate Embeddings & Upsert
-    points = []
-    print("Generating embeddings...")
-    
-    BATCH_SIZE = 20
-    
-    current_count = 0
-    if args.append:
-        try:
-            collection_info = client.get_collection(COLLECTION_NAME)
-            current_count = collection_info.points_count
-            print(f"Starting with index {current_count}")
-        except Exception:
-            pass
+    # 2-5. Extract -> chunk -> embed -> upsert, streamed page by page.
+    # Chunks already in the manifest are skipped, so only new/changed ones are embedded.
+    print("Extracting, chunking and embedding...")
+    limiter = AdaptiveRateLimiter(args.rpm, args.tpm)
+    failed_pages = []  # pages that timed out or whose OCR failed
+    pages = timed_iter(
+        iter_page_texts(pdf_path, use_ocr=args.ocr, workers=args.workers, page_timeout=args.page_timeout,
+                        failed_pages=failed_pages),
+        "extract",
+    )
+    # Near-duplicates (e.g. OCR text repeating the page's text layer) are dropped before embedding
+    dedup = NearDuplicateFilter()
+    chunks = iter_chunks(pages, dedup=dedup)
+    counts, seen_ids = ingest_stream(
+        store, chunks, pdf_path, manifest, limiter, batch_size=args.batch_size, workers=args.embed_workers
+    )
+    print(f"{counts['chunks']} chunks: {counts['embedded']} embedded, {counts['unchanged']} unchanged, {counts['failed']} failed; "
+          f"{dedup.dropped} near-duplicates dropped.")
 
-    for idx, chunk_text_content in enumerate(text_chunks):
-        try:
-            embedding = get_embedding(chunk_text_content)
-            
-            if embedding:
-                point = PointStruct(
-                    id=current_count + idx,
-                    vector=embedding,
-                    payload={"text": chunk_text_content, "source": pdf_path}
-                )
-                points.append(point)
-                
-                time.sleep(1)
-            else:
-                print(f"Skipping chunk {idx} due to embedding failure.")
+    if counts["chunks"] == 0:
+        print("Error: No text extracted. Aborting.")
+        save_manifest(manifest)
+        return
 
-            if (idx + 1) % 10 == 0:
-                print(f"Processed {idx + 1}/{len(text_chunks)} chunks.")
-                
-        except Exception as e:
-            print(f"Error processing chunk {idx}: {e}")
+    collection_manifest = manifest[COLLECTION_NAME]
+    changed = counts["embedded"] > 0
+    if failed_pages:
+        # Chunks of those pages weren't seen this run; they are not stale, so keep all of this file's points
+        print(f"Warning: {len(failed_pages)} page(s) not fully extracted ({', '.join(map(str, failed_pages))}); "
+              f"keeping existing points of {pdf_path}. Re-run to retry them.")
+        seen_ids = seen_ids | set(collection_manifest.get(pdf_path, {}))
+    stale_ids = stale_point_ids(manifest, COLLECTION_NAME, pdf_path, seen_ids, other_sources_stale=not args.append)
+    BATCH_SIZE = 1000
 
-    # 5. Upsert
-    if points:
-        print(f"Upserting {len(points)} points to Qdrant...")
-        for i in range(0, len(points), BATCH_SIZE):
-            batch = points[i:i + BATCH_SIZE]
+    # 6. Remove chunks that no longer exist in the source (or other sources when not appending)
+    if stale_ids:
+        print(f"Deleting {len(stale_ids)} stale points...")
+        for i in range(0, len(stale_ids), BATCH_SIZE):
+            batch = stale_ids[i:i + BATCH_SIZE]
             try:
-                client.upsert(
-                    collection_name=COLLECTION_NAME,
-                    wait=True,
-                    points=batch
-                )
-                print(f"Upserted batch {i // BATCH_SIZE + 1}")
+                store.delete(COLLECTION_NAME, batch)
+                stale = set(batch)
+                for source in list(collection_manifest):
+                    entries = collection_manifest[source]
+                    for point_id in stale.intersection(entries):
+                        del entries[point_id]
+                    if not entries and source != pdf_path:
+                        del collection_manifest[source]
+                changed = True
             except Exception as e:
-                print(f"Error upserting batch {i // BATCH_SIZE + 1}: {e}")
-            time.sleep(1)
-            
+                print(f"Error deleting stale points: {e}")
+
+    save_manifest(manifest)
+    print("Stage timings (embed/upsert overlap with extraction):")
+    print_stage_summary()
+    if changed:
+        # Invalidate caches built on top of the previous collection contents
+        corpus_version.bump_version(COLLECTION_NAME)
         print("Done! Collection updated.")
     else:
-        print("No points to upsert.")
+        print("Collection already up to date.")
 
 if __name__ == "__main__":
     try:
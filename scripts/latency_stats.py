@@ -0,0 +1,15 @@
+def percentile(values, p):
+    """Nearest-rank percentile of `values` (p in 0-100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+def latency_stats(seconds):
+    """p50/p95/p99/mean/max of a list of durations, in milliseconds."""
+    if not seconds:
+        return None
+    stats = {f"p{p}": round(percentile(seconds, p) * 1000, 3) for p in (50, 95, 99)}
+    stats["mean"] = round(sum(seconds) / len(seconds) * 1000, 3)
+    stats["max"] = round(max(seconds) * 1000, 3)
+    return stats
@@ -0,0 +1,412 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+import httpx
+from pypdf import PdfReader
+from PIL import Image, ImageDraw
+import embeddings
+import vector_store
+from chunking import iter_chunks, NearDuplicateFilter
+from ingest_manifest import content_hash, chunk_point_id
+from latency_stats import latency_stats
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLLECTION_NAME = "ai_structured_collection_v2"  # collection searched by retrieve.py
+DEFAULT_CORPUS = os.path.join(REPO_ROOT, "data", "Artificial_Intelligence_Expanded_Detailed_Report.pdf")
+DEFAULT_ATTACHMENT = os.path.join(REPO_ROOT, "data", "ocr-test-doc.pdf")
+
+# Request mix: scenario -> relative weight
+DEFAULT_MIX = "plain=4,stream=2,history=2,pdf=1,image=1,list=1"
+SCENARIO_ENDPOINTS = {
+    "plain": "POST /api/chat",
+    "stream": "POST /api/chat/stream",
+    "history": "POST /api/chat",
+    "pdf": "POST /api/chat",
+    "image": "POST /api/chat",
+    "list": "GET /api/conversations",
+}
+
+QUESTIONS = [
+    "What is Deep Learning?",
+    "Define NLP",
+    "How do Transformers work?",
+    "What are vector databases?",
+    "Explain Generative AI",
+    "What are the main risks of AI systems?",
+    "Summarize the history of machine learning",
+]
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIO_ENDPOINTS:
+            raise ValueError(f"Unknown scenario {name!r} (expected one of {', '.join(SCENARIO_ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def stand_in_env(workdir, args):
+    """Environment that swaps Gemini, Qdrant and PostgreSQL for local stand-ins."""
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'loadtest.sqlite3')}",
+        "DB_ASYNC": "false",
+        "VECTOR_STORE": "numpy",
+        "VECTOR_STORE_PATH": os.path.join(workdir, "vectors"),
+        "PREFIX_DIM": "0",
+        "EMBEDDING_PROVIDER": "fake",
+        "EMBEDDING_CACHE_PATH": "",
+        "EXTRACTION_CACHE_DIR": os.path.join(workdir, "extraction"),
+        "GENERATION_BACKEND": "fake",
+        "FAKE_GEN_LATENCY": str(args.gen_latency),
+        "FAKE_GEN_TOKENS": str(args.gen_tokens),
+        "FAKE_GEN_TOKENS_PER_SEC": str(args.gen_tokens_per_sec),
+        "FAKE_GEN_ERROR_RATE": str(args.gen_error_rate),
+        "SECRET_KEY": "loadtest-secret",
+        "WARMUP": "true",  # measure a warmed-up server; startup waits on /ready
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def seed_vector_store(path, corpus):
+    """Embeds `corpus` with the fake provider into a numpy store (the app's in-memory index)."""
+    provider = embeddings.HashEmbeddingProvider()
+    store = vector_store.NumpyStore(path)
+    store.create_collection(COLLECTION_NAME, provider.dimension, embeddings.provider_metadata(provider))
+    pages = (page.extract_text() or "" for page in PdfReader(corpus).pages)
+    chunks = list(iter_chunks(pages, dedup=NearDuplicateFilter()))
+    for start in range(0, len(chunks), 100):
+        batch = chunks[start:start + 100]
+        store.upsert(
+            COLLECTION_NAME,
+            [chunk_point_id(corpus, content_hash(text)) for text in batch],
+            provider.embed(batch, "retrieval_document"),
+            [{"text": text, "source": os.path.basename(corpus), "chunk_index": start + i} for i, text in enumerate(batch)],
+        )
+    print(f"Seeded vector store with {len(chunks)} chunks from {corpus}")
+
+
+def seed_history(env, emails, conversations_per_user, turns):
+    """Inserts long conversations straight into the SQLite database for the history scenario."""
+    os.environ["DATABASE_URL"] = env["DATABASE_URL"]
+    sys.path.insert(0, REPO_ROOT)
+    from backend.database import SessionLocal, User, Conversation, Message
+
+    db = SessionLocal()
+    try:
+        conversation_ids = {}
+        for email in emails:
+            user = db.query(User).filter(User.email == email).first()
+            ids = []
+            for c in range(conversations_per_user):
+                conversation = Conversation(title=f"History {c}", user_id=user.id)
+                db.add(conversation)
+                db.flush()
+                for t in range(turns):
+                    question = QUESTIONS[t % len(QUESTIONS)]
+                    db.add(Message(conversation_id=conversation.id, sender="user", content=question))
+                    db.add(Message(conversation_id=conversation.id, sender="bot", content=f"Answer {t}: " + question * 8))
+                ids.append(conversation.id)
+            conversation_ids[email] = ids
+        db.commit()
+        return conversation_ids
+    finally:
+        db.close()
+
+
+def sample_png():
+    img = Image.new("RGB", (480, 140), "white")
+    ImageDraw.Draw(img).text((10, 50), "Invoice 1042: total due 318.50 EUR", fill="black")
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def start_server(env, port, log_path):
+    log = open(log_path, "w", encoding="utf-8")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", "1", "--log-level", "warning"],
+        cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return process, log
+
+
+async def wait_until_up(client, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("Server exited during startup; see the server log")
+        try:
+            response = await client.get("/ready")
+        except httpx.TransportError:
+            await asyncio.sleep(0.25)
+            continue
+        if response.status_code != 503:
+            return
+        if response.json().get("error"):
+            raise RuntimeError(f"Server failed to start: {response.json()['error']}")
+        await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server not reachable after {timeout}s")
+
+
+async def create_users(client, count):
+    tokens = {}
+    for i in range(count):
+        email, password = f"loadtest{i}@example.com", "loadtest-password"
+        await client.post("/api/auth/signup", json={"email": email, "password": password})
+        response = await client.post("/api/auth/login", data={"username": email, "password": password})
+        response.raise_for_status()
+        tokens[email] = response.json()["access_token"]
+    return tokens
+
+
+class Recorder:
+    """Per-scenario latencies and errors for one load stage."""
+
+    def __init__(self):
+        self.samples = {}   # scenario -> [seconds]
+        self.ttft = {}      # scenario -> [seconds to first streamed token]
+        self.errors = {}    # scenario -> {reason: count}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def record(self, scenario, seconds, error=None, ttft=None):
+        self.samples.setdefault(scenario, []).append(seconds)
+        if ttft is not None:
+            self.ttft.setdefault(scenario, []).append(ttft)
+        if error:
+            reasons = self.errors.setdefault(scenario, {})
+            reasons[error] = reasons.get(error, 0) + 1
+
+
+async def run_scenario(client, scenario, user, token, history_ids, attachment_pdf, attachment_png, recorder, timeout):
+    headers = {"Authorization": f"Bearer {token}"}
+    data = {"message": random.choice(QUESTIONS)}
+    files = None
+    if scenario == "history":
+        data["conversation_id"] = str(random.choice(history_ids[user]))
+    elif scenario == "pdf":
+        files = {"file": ("attachment.pdf", attachment_pdf, "application/pdf")}
+    elif scenario == "image":
+        files = {"file": ("note.png", attachment_png, "image/png")}
+
+    recorder.in_flight += 1
+    recorder.max_in_flight = max(recorder.max_in_flight, recorder.in_flight)
+    start = time.perf_counter()
+    error = None
+    ttft = None
+    try:
+        if scenario == "list":
+            response = await client.get("/api/conversations", params={"limit": 20}, headers=headers, timeout=timeout)
+            if response.status_code >= 400:
+                error = f"HTTP {response.status_code}"
+        elif scenario == "stream":
+            async with client.stream("POST", "/api/chat/stream", data=data, headers=headers, timeout=timeout) as response:
+                if response.status_code >= 400:
+                    error = f"HTTP {response.status_code}"
+                async for line in response.aiter_lines():
+                    if ttft is None and line == "event: token":
+                        ttft = time.perf_counter() - start
+                    elif line == "event: error":
+                        error = "stream error event"
+        else:
+            response = await client.post("/api/chat", data=data, files=files, headers=headers, timeout=timeout)
+            if response.status_code >= 400:
+                error = f"HTTP {response.status_code}"
+            elif response.json().get("response", "").startswith("I'm sorry, I encountered an error"):
+                error = "generation error"
+    except httpx.TimeoutException:
+        error = "timeout"
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+    finally:
+        recorder.in_flight -= 1
+    recorder.record(scenario, time.perf_counter() - start, error, ttft)
+
+
+async def run_stage(client, rps, duration, mix, tokens, history_ids, attachment_pdf, attachment_png, timeout):
+    """Open-loop load: arrivals are scheduled at `rps` regardless of response times."""
+    recorder = Recorder()
+    users = list(tokens)
+    scenarios = list(mix)
+    weights = [mix[s] for s in scenarios]
+    tasks = []
+    start = time.perf_counter()
+    for i in range(int(rps * duration)):
+        delay = start + i / rps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        user = random.choice(users)
+        scenario = random.choices(scenarios, weights)[0]
+        tasks.append(asyncio.create_task(run_scenario(
+            client, scenario, user, tokens[user], history_ids, attachment_pdf, attachment_png, recorder, timeout
+        )))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - start
+    return summarize_stage(rps, wall, recorder)
+
+
+def summarize_stage(rps, wall, recorder):
+    scenarios = {}
+    all_samples = []
+    total_errors = 0
+    for scenario, samples in sorted(recorder.samples.items()):
+        errors = sum(recorder.errors.get(scenario, {}).values())
+        total_errors += errors
+        all_samples.extend(samples)
+        scenarios[scenario] = {
+            "endpoint": SCENARIO_ENDPOINTS[scenario],
+            "requests": len(samples),
+            "throughput_rps": round(len(samples) / wall, 2),
+            "error_rate": round(errors / len(samples), 4),
+            "errors": recorder.errors.get(scenario, {}),
+            "latency_ms": latency_stats(samples),
+        }
+        if scenario in recorder.ttft:
+            scenarios[scenario]["ttft_ms"] = latency_stats(recorder.ttft[scenario])
+    total = len(all_samples)
+    return {
+        "target_rps": rps,
+        "throughput_rps": round(total / wall, 2),  # completions over the stage incl. drain
+        "requests": total,
+        "error_rate": round(total_errors / total, 4) if total else 0.0,
+        "latency_ms": latency_stats(all_samples),
+        "max_in_flight": recorder.max_in_flight,
+        # Little's law: mean concurrency = throughput x mean latency
+        "mean_in_flight": round(total / wall * (sum(all_samples) / total), 2) if total else 0.0,
+        "scenarios": scenarios,
+    }
+
+
+def print_stage(stage):
+    overall = stage["latency_ms"]
+    print(f"\n=== target {stage['target_rps']} rps: throughput {stage['throughput_rps']} rps, "
+          f"{stage['requests']} requests, errors {stage['error_rate']:.2%}, "
+          f"in flight mean {stage['mean_in_flight']} / max {stage['max_in_flight']}")
+    if overall:
+        print(f"    all        p50/p95/p99 = {overall['p50']:.0f}/{overall['p95']:.0f}/{overall['p99']:.0f} ms")
+    for scenario, stats in stage["scenarios"].items():
+        latency = stats["latency_ms"]
+        line = (f"    {scenario:<10} {stats['requests']:>5} req {stats['throughput_rps']:>7.2f} rps  "
+                f"p50/p95/p99 = {latency['p50']:.0f}/{latency['p95']:.0f}/{latency['p99']:.0f} ms  "
+                f"errors {stats['error_rate']:.2%}")
+        if "ttft_ms" in stats:
+            line += f"  ttft p50 {stats['ttft_ms']['p50']:.0f} ms"
+        print(line)
+
+
+async def run(args):
+    mix = parse_mix(args.mix)
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    env = stand_in_env(workdir, args)
+    process = log = None
+    base_url = args.url
+    if not base_url:
+        seed_vector_store(env["VECTOR_STORE_PATH"], args.corpus)
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        process, log = start_server(env, port, os.path.join(workdir, "server.log"))
+        print(f"Started app on {base_url} with fake Gemini, numpy vector store and SQLite (logs: {workdir})")
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+            await wait_until_up(client, process)
+            tokens = await create_users(client, args.users)
+            history_ids = {}
+            if "history" in mix:
+                if args.url:
+                    print("Skipping history scenario: conversations can only be seeded into the harness's own database")
+                    mix.pop("history")
+                else:
+                    history_ids = seed_history(env, list(tokens), args.history_conversations, args.history_turns)
+            with open(args.attachment, "rb") as f:
+                attachment_pdf = f.read()
+            attachment_png = sample_png()
+
+            if args.warmup:
+                await run_stage(client, args.warmup, 2, mix, tokens, history_ids, attachment_pdf, attachment_png, args.timeout)
+
+            stages = []
+            for rps in args.rps:
+                stage = await run_stage(client, rps, args.duration, mix, tokens, history_ids,
+                                        attachment_pdf, attachment_png, args.timeout)
+                print_stage(stage)
+                stages.append(stage)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+            log.close()
+
+    sustainable = [s["target_rps"] for s in stages
+                   if s["error_rate"] <= args.max_error_rate and s["latency_ms"] and s["latency_ms"]["p95"] <= args.slo_ms]
+    print(f"\nHighest stage within SLO (p95 <= {args.slo_ms:.0f} ms, errors <= {args.max_error_rate:.0%}): "
+          f"{max(sustainable) if sustainable else 'none'} rps")
+
+    if args.output:
+        report = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "mix": mix,
+            "duration_seconds": args.duration,
+            "generator": {
+                "latency_seconds": args.gen_latency,
+                "tokens": args.gen_tokens,
+                "tokens_per_sec": args.gen_tokens_per_sec,
+                "error_rate": args.gen_error_rate,
+            },
+            "slo_p95_ms": args.slo_ms,
+            "max_sustainable_rps": max(sustainable) if sustainable else None,
+            "stages": stages,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Report written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of /api/chat with local stand-ins for Gemini, Qdrant and PostgreSQL")
+    parser.add_argument("--rps", type=float, nargs="+", default=[2, 5, 10], help="Target request rates, one stage each")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per stage")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=10, help="Distinct users sending requests")
+    parser.add_argument("--history-conversations", type=int, default=2, help="Seeded long conversations per user")
+    parser.add_argument("--history-turns", type=int, default=40, help="Turns in each seeded conversation")
+    parser.add_argument("--gen-latency", type=float, default=0.5, help="Fake generator seconds to first token")
+    parser.add_argument("--gen-tokens", type=int, default=150, help="Fake generator tokens per answer")
+    parser.add_argument("--gen-tokens-per-sec", type=float, default=80, help="Fake generator token rate")
+    parser.add_argument("--gen-error-rate", type=float, default=0.0, help="Share of fake generator calls that fail")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="PDF embedded into the stand-in vector store")
+    parser.add_argument("--attachment", default=DEFAULT_ATTACHMENT, help="PDF uploaded by the pdf scenario")
+    parser.add_argument("--warmup", type=float, default=2, help="Warm-up rate for 2 seconds before the stages (0 = none)")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--slo-ms", type=float, default=5000, help="p95 latency target used to pick the sustainable rate")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error rate allowed within the SLO")
+    parser.add_argument("--url", help="Target an already-running app instead of starting one (history scenario is skipped)")
+    parser.add_argument("--output", help="Write a JSON report to this path")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
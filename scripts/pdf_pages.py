@@ -0,0 +1,154 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import pdfplumber
+import pytesseract
+from dotenv import load_dotenv
+import extraction_cache
+
+# Load environment variables
+load_dotenv()
+
+# Configure tesseract executable path
+pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_CMD", r'C:\Program Files\Tesseract-OCR\tesseract.exe')
+
+OCR_RESOLUTION = 300
+# Seconds allowed for OCR of a single page (0 disables the limit)
+PAGE_TIMEOUT = float(os.getenv("OCR_PAGE_TIMEOUT", "120"))
+
+
+def ocr_image(pil_img, ocr_timeout=PAGE_TIMEOUT):
+    """Tesseract OCR of a PIL image, cached by the image's pixel bytes."""
+    cache = extraction_cache.get_default_cache()
+    if cache is None:
+        return pytesseract.image_to_string(pil_img, timeout=ocr_timeout)
+    key = extraction_cache.make_key(pil_img.tobytes(), "ocr", pil_img.size, pil_img.mode)
+    return cache.get_or_compute(key, lambda: pytesseract.image_to_string(pil_img, timeout=ocr_timeout))
+
+
+def _extract_page_uncached(page, page_number, use_ocr, ocr_timeout):
+    """Returns (page_text, complete); complete is False when OCR failed."""
+    page_text = ""
+
+    # Try direct text extraction
+    text = page.extract_text()
+    if text:
+        page_text += text + "\n"
+
+    # Check for images or low text count to trigger OCR
+    if use_ocr and (len(page.images) > 0 or (text and len(text) < 100)):
+        print(f"  OCR triggered for page {page_number}...")
+        try:
+            # Render page to image (PageImage isn't a context manager in current pdfplumber)
+            pil_img = page.to_image(resolution=OCR_RESOLUTION).original
+            ocr_text = ocr_image(pil_img, ocr_timeout=ocr_timeout)
+            if ocr_text:
+                print(f"  OCR extracted {len(ocr_text)} characters from page {page_number}.")
+                page_text += "\n--- OCR Data ---\n" + ocr_text + "\n"
+        except Exception as e:
+            print(f"  OCR failed for page {page_number}: {e}")
+            return page_text, False
+
+    return page_text, True
+
+
+def extract_page(page, page_number, use_ocr=True, ocr_timeout=PAGE_TIMEOUT, file_key=None):
+    """Returns (text, complete): the text layer of a pdfplumber page plus OCR output when the page needs it.
+
+    `complete` is False when OCR failed, so the text may be missing part of
+    the page. With `file_key` (the PDF's digest) complete page results are
+    cached, so a re-ingest of an unchanged file skips extraction, rendering
+    and OCR.
+    """
+    cache = extraction_cache.get_default_cache()
+    key = None
+    if cache is not None and file_key:
+        key = extraction_cache.make_key(file_key.encode("utf-8"), "page", page_number, use_ocr, OCR_RESOLUTION)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, True
+
+    page_text, complete = _extract_page_uncached(page, page_number, use_ocr, ocr_timeout)
+    if key is not None and complete:
+        cache.set(key, page_text)
+    return page_text, complete
+
+
+# --- Process-pool workers ---
+# Each worker opens the PDF once in its initializer; tasks only carry a page index.
+_worker_pdf = None
+_worker_file_key = None
+
+
+def _init_worker(pdf_path, file_key):
+    global _worker_pdf, _worker_file_key
+    _worker_pdf = pdfplumber.open(pdf_path)
+    _worker_file_key = file_key
+
+
+def _extract_page_in_worker(index, use_ocr, ocr_timeout):
+    page = _worker_pdf.pages[index]
+    try:
+        return extract_page(page, index + 1, use_ocr=use_ocr, ocr_timeout=ocr_timeout, file_key=_worker_file_key)
+    finally:
+        # Drop pdfplumber's cached layout objects for this page
+        page.close()
+
+
+def count_pages(pdf_path):
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def iter_page_texts(pdf_path, use_ocr=True, workers=1, page_timeout=PAGE_TIMEOUT, failed_pages=None):
+    """Lazily yields the extracted (and OCR'd, if needed) text of each page, in order.
+
+    With `workers > 1` pages are rendered and OCR'd in a process pool. At most
+    `2 * workers` pages are in flight, so a slow consumer throttles extraction.
+    A page that exceeds `page_timeout` seconds or whose worker fails is yielded
+    as empty text. Pages yielded incomplete (those, and pages whose OCR failed)
+    are appended, 1-based, to `failed_pages` when a list is given.
+    """
+    file_key = extraction_cache.file_digest(pdf_path) if extraction_cache.get_default_cache() else None
+
+    def failed(page_number):
+        if failed_pages is not None:
+            failed_pages.append(page_number)
+
+    if workers <= 1:
+        with pdfplumber.open(pdf_path) as pdf:
+            total_pages = len(pdf.pages)
+            for i, page in enumerate(pdf.pages):
+                print(f"Processing page {i+1}/{total_pages}...")
+                page_text, complete = extract_page(page, i + 1, use_ocr=use_ocr, ocr_timeout=page_timeout, file_key=file_key)
+                page.close()
+                if not complete:
+                    failed(i + 1)
+                yield page_text
+        return
+
+    total_pages = count_pages(pdf_path)
+    # The future-level timeout is a backstop on top of tesseract's own timeout,
+    # leaving headroom for text extraction and rendering.
+    result_timeout = page_timeout * 2 if page_timeout else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pdf_path, file_key)) as pool:
+        in_flight = deque()
+        next_page = 0
+        while next_page < total_pages or in_flight:
+            while next_page < total_pages and len(in_flight) < 2 * workers:
+                in_flight.append((next_page, pool.submit(_extract_page_in_worker, next_page, use_ocr, page_timeout)))
+                next_page += 1
+            index, future = in_flight.popleft()
+            print(f"Processing page {index+1}/{total_pages}...")
+            try:
+                page_text, complete = future.result(timeout=result_timeout)
+            except FutureTimeoutError:
+                print(f"  Page {index+1} timed out after {result_timeout:.0f}s; skipping.")
+                future.cancel()
+                page_text, complete = "", False
+            except Exception as e:
+                print(f"  Extraction failed for page {index+1}: {e}")
+                page_text, complete = "", False
+            if not complete:
+                failed(index + 1)
+            yield page_text
@@ -0,0 +1,76 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `per_minute / 60` units per second."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.per_minute = float(per_minute)
+        self.available = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def refill(self, scale):
+        now = time.monotonic()
+        rate = self.per_minute * scale / 60.0
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+    def wait_time(self, amount, scale):
+        """Seconds until `amount` units are available at the current (scaled) rate."""
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        rate = self.per_minute * scale / 60.0
+        return (amount - self.available) / rate
+
+
+class AdaptiveRateLimiter:
+    """Thread-safe limiter over requests/min and tokens/min that reacts to 429s.
+
+    Each 429 halves the effective rate and pauses all callers for `cooldown`
+    seconds; every successful call recovers a little of the rate (AIMD), so
+    the limiter settles just under whatever quota the API actually grants.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, min_scale=0.05, recovery=0.02, cooldown=5.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.min_scale = min_scale
+        self.recovery = recovery
+        self.cooldown = cooldown
+        self.scale = 1.0
+        self.blocked_until = 0.0
+        self.rate_limited_count = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens=1):
+        """Blocks until one request carrying `tokens` tokens may be sent."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    self._cond.wait(self.blocked_until - now)
+                    continue
+                self.requests.refill(self.scale)
+                self.tokens.refill(self.scale)
+                wait = max(self.requests.wait_time(1, self.scale), self.tokens.wait_time(tokens, self.scale))
+                if wait <= 0:
+                    self.requests.available -= 1
+                    self.tokens.available -= min(tokens, self.tokens.capacity)
+                    return
+                self._cond.wait(wait)
+
+    def on_success(self):
+        with self._cond:
+            self.scale = min(1.0, self.scale + self.recovery)
+
+    def on_rate_limited(self, retry_after=None):
+        with self._cond:
+            self.rate_limited_count += 1
+            self.scale = max(self.min_scale, self.scale / 2)
+            pause = retry_after if retry_after is not None else self.cooldown
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+            print(f"Rate limited: effective rate now {self.scale:.0%} of quota, pausing {pause:.1f}s")
+            self._cond.notify_all()
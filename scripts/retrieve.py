@@ -1,44 +1,101 @@
 import os
-import google.generativeai as genai
-from qdrant_client import QdrantClient
+import threading
 from dotenv import load_dotenv
+import embedding_cache
+import embeddings
+import vector_store
+import context_packing
+import metrics
 
 # Load environment variables
 load_dotenv()
 
 # Configuration
-QDRANT_URL = os.getenv("QDRANT_URL")
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY is missing in .env file.")
+# Collection Configuration
+COLLECTION_NAME = "ai_structured_collection_v2"
 
-# Initialize Gemini
-genai.configure(api_key=GOOGLE_API_KEY)
+# The vector store (VECTOR_STORE, see vector_store.py), embedding provider
+# (EMBEDDING_PROVIDER, see embeddings.py) and Gemini client are created on first
+# use, so importing this module stays cheap and a missing key fails the first
+# call instead of the import.
+_genai = None
+_genai_lock = threading.Lock()
 
-# Initialize Qdrant Client
-client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=60)
+def get_genai():
+    """Imports and configures google.generativeai once (generation in the backend)."""
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            if GOOGLE_API_KEY:
+                genai.configure(api_key=GOOGLE_API_KEY)
+            _genai = genai
+    return _genai
 
-# Collection Configuration
-COLLECTION_NAME = "ai_structured_collection_v2"
-EMBEDDING_MODEL = "models/gemini-embedding-001"
-VECTOR_SIZE = 768
+_collection_checked = False
+
+def ensure_collection_matches():
+    """Refuses to search a collection embedded by a different provider (checked once)."""
+    global _collection_checked
+    if not _collection_checked:
+        metadata = vector_store.get_store().collection_metadata(COLLECTION_NAME)
+        embeddings.check_collection_provider(metadata, COLLECTION_NAME, embeddings.get_provider())
+        _collection_checked = True
+
+async def ensure_collection_matches_async():
+    global _collection_checked
+    if not _collection_checked:
+        metadata = await vector_store.get_store().collection_metadata_async(COLLECTION_NAME)
+        embeddings.check_collection_provider(metadata, COLLECTION_NAME, embeddings.get_provider())
+        _collection_checked = True
+
+def _embed_query(text):
+    return embeddings.get_provider().embed([text], "retrieval_query")[0]
 
 def get_embedding(text):
-    """Generates embedding for the given text using Gemini API."""
-    result = genai.embed_content(
-        model=EMBEDDING_MODEL,
-        content=text,
-        task_type="retrieval_query",
-    )
-    embedding = result['embedding']
-    if len(embedding) > VECTOR_SIZE:
-        embedding = embedding[:VECTOR_SIZE]
-    return embedding
+    """Generates the query embedding with the configured provider (cached)."""
+    with metrics.stage("embed"):
+        return embedding_cache.cached_embedding(
+            embedding_cache.get_default_cache(), text, embeddings.get_provider().signature, "retrieval_query", _embed_query
+        )
+
+async def _embed_query_async(text):
+    return (await embeddings.get_provider().aembed([text], "retrieval_query"))[0]
+
+async def get_embedding_async(text):
+    """Async variant of get_embedding for use inside the event loop."""
+    with metrics.stage("embed"):
+        return await embedding_cache.cached_embedding_async(
+            embedding_cache.get_default_cache(), text, embeddings.get_provider().signature, "retrieval_query", _embed_query_async
+        )
+
+async def embed_documents_async(texts, batch_size=100):
+    """Embeds document chunks (retrieval_document) in batches.
+
+    Not cached: an attachment's chunks are embedded once per conversation
+    index, and storing them would evict the query embeddings from the shared
+    cache.
+    """
+    provider = embeddings.get_provider()
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        with metrics.stage("embed_documents"):
+            vectors.extend(await provider.aembed(texts[start:start + batch_size], "retrieval_document"))
+    return vectors
+
+def _fetch_size(limit):
+    """Hits to fetch for `limit` results: over-fetch RETRIEVAL_CANDIDATES (with vectors) for MMR."""
+    return max(limit, context_packing.RETRIEVAL_CANDIDATES)
 
 def search(query, limit=3):
-    """Searches the Qdrant collection for the query."""
+    """Searches the vector store for the query.
+
+    Over-fetched candidates are diversified with MMR down to `limit`, adjacent
+    chunks are merged and the result is packed into CONTEXT_TOKEN_BUDGET
+    (see context_packing.py).
+    """
     print(f"Query: {query}")
     print("Generating embedding...")
     try:
@@ -47,30 +104,47 @@ def search(query, limit=3):
         print(f"Error generating embedding: {e}")
         return []
 
-    print("Searching Qdrant...")
+    print(f"Searching {vector_store.VECTOR_STORE}...")
     try:
-        search_result = client.query_points(
-            collection_name=COLLECTION_NAME,
-            query=query_vector,
-            limit=limit
-        )
-        hits = search_result.points
-
-        print(f"\nFound {len(hits)} results:")
-        results = []
-        for i, hit in enumerate(hits):
-            print(f"\n--- Result {i+1} (Score: {hit.score:.4f}) ---")
-            print(f"Text: {hit.payload.get('text', 'N/A')}")
-            print(f"Source: {hit.payload.get('source', 'N/A')}")
-            results.append({
-                "text": hit.payload.get('text', 'N/A'),
-                "source": hit.payload.get('source', 'N/A'),
-                "score": hit.score
-            })
+        ensure_collection_matches()
+        fetch = _fetch_size(limit)
+        with metrics.stage("search"):
+            hits = vector_store.get_store().search(COLLECTION_NAME, query_vector, fetch, with_vectors=fetch > limit)
+        with metrics.stage("rerank"):
+            results = context_packing.select(query_vector, hits, limit)
+
+        print(f"\nFound {len(results)} results:")
+        for i, res in enumerate(results):
+            print(f"\n--- Result {i+1} (Score: {res['score']:.4f}) ---")
+            print(f"Text: {res['text']}")
+            print(f"Source: {res['source']}")
         return results
             
     except Exception as e:
-        print(f"Error searching Qdrant: {e}")
+        print(f"Error searching vector store: {e}")
+        return []
+
+async def search_async(query, limit=3):
+    """Non-blocking search used by the backend: async embedding + async store search, then rerank/pack."""
+    try:
+        query_vector = await get_embedding_async(query)
+    except Exception as e:
+        print(f"Error generating embedding: {e}")
+        return []
+
+    try:
+        await ensure_collection_matches_async()
+        fetch = _fetch_size(limit)
+        with metrics.stage("search"):
+            hits = await vector_store.get_store().search_async(
+                COLLECTION_NAME, query_vector, fetch, with_vectors=fetch > limit
+            )
+        with metrics.stage("rerank"):
+            results = context_packing.select(query_vector, hits, limit)
+        print(f"Found {len(results)} results for query: {query}")
+        return results
+    except Exception as e:
+        print(f"Error searching vector store: {e}")
         return []
 
 def main():
@@ -0,0 +1,449 @@
+import os
+import json
+import asyncio
+import threading
+from dotenv import load_dotenv
+import collection_profiles
+from embeddings import reduce_dimension
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+VECTOR_STORE = os.getenv("VECTOR_STORE", "qdrant")  # qdrant | qdrant_local | numpy
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_PATH = os.getenv("QDRANT_PATH", "data/qdrant")  # qdrant_local storage directory
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "data/vector_store")  # numpy store directory
+# Two-stage search: candidates from a PREFIX_DIM-d Matryoshka prefix (0 = off, set
+# at collection creation), then PREFIX_CANDIDATES x limit of them rescored at full size
+PREFIX_DIM = int(os.getenv("PREFIX_DIM", "0"))
+PREFIX_CANDIDATES = int(os.getenv("PREFIX_CANDIDATES", "4"))
+# numpy: async searches of collections up to this many rows scan on the event loop
+# (a few ms at 768-d); larger ones run in a worker thread
+NUMPY_INLINE_ROWS = int(os.getenv("NUMPY_INLINE_ROWS", "10000"))
+
+# Collection metadata key recording the prefix size; Qdrant named vectors used with it
+PREFIX_METADATA_KEY = "prefix_dim"
+FULL_VECTOR = "full"
+PREFIX_VECTOR = "prefix"
+
+
+def _result(point_id, payload, score, vector=None):
+    result = {
+        "id": point_id,
+        "text": payload.get("text", "N/A"),
+        "source": payload.get("source", "N/A"),
+        "score": float(score),
+    }
+    if payload.get("chunk_index") is not None:
+        result["chunk_index"] = payload["chunk_index"]  # position in the source, for merging neighbours
+    if vector is not None:
+        result["vector"] = vector
+    return result
+
+
+def _hit_result(hit):
+    vector = hit.vector.get(FULL_VECTOR) if isinstance(hit.vector, dict) else hit.vector
+    return _result(hit.id, hit.payload, hit.score, vector)
+
+
+class QdrantStore:
+    """Qdrant collections, either on a server or in qdrant-client's local (on-disk) mode.
+
+    Local mode locks its storage directory, so only one client may use it per
+    process; without an async client, async searches run the sync client in a thread.
+    """
+
+    def __init__(self, client, async_client=None):
+        self.client = client
+        self.async_client = async_client
+        self._collections = {}  # collection -> (metadata, SearchParams of its tuning profile)
+
+    def _remember(self, name, metadata):
+        profile = metadata.get(collection_profiles.PROFILE_METADATA_KEY, "default")
+        self._collections[name] = (metadata, collection_profiles.search_params(profile))
+        return self._collections[name]
+
+    def _collection(self, name):
+        return self._collections.get(name) or self._remember(name, self.collection_metadata(name))
+
+    async def _collection_async(self, name):
+        return self._collections.get(name) or self._remember(name, await self.collection_metadata_async(name))
+
+    def collection_exists(self, name):
+        return self.client.collection_exists(name)
+
+    def create_collection(self, name, dimension, metadata=None, profile="default", prefix_dim=0):
+        """Creates a cosine collection tuned by `profile` (see collection_profiles.py).
+
+        With `prefix_dim`, points get a "full" and a "prefix" named vector for
+        two-stage search.
+        """
+        from qdrant_client.models import VectorParams, Distance
+        config = collection_profiles.collection_config(profile)
+        vectors_config = VectorParams(size=dimension, distance=Distance.COSINE, on_disk=config.pop("on_disk"))
+        metadata = dict(metadata or {}, **{collection_profiles.PROFILE_METADATA_KEY: profile})
+        if prefix_dim:
+            vectors_config = {
+                FULL_VECTOR: vectors_config,
+                PREFIX_VECTOR: VectorParams(size=prefix_dim, distance=Distance.COSINE),
+            }
+            metadata[PREFIX_METADATA_KEY] = prefix_dim
+        self._collections.pop(name, None)
+        try:
+            self.client.create_collection(
+                collection_name=name, vectors_config=vectors_config, metadata=metadata, **config
+            )
+        except TypeError:
+            # qdrant-client releases without collection metadata support
+            print("Warning: qdrant-client does not support collection metadata; provider and profile not recorded.")
+            self.client.create_collection(collection_name=name, vectors_config=vectors_config, **config)
+
+    def delete_collection(self, name):
+        self._collections.pop(name, None)
+        self.client.delete_collection(name)
+
+    def collection_metadata(self, name):
+        info = self.client.get_collection(name)
+        return getattr(info.config, "metadata", None) or {}
+
+    async def collection_metadata_async(self, name):
+        if self.async_client is None:
+            return await asyncio.to_thread(self.collection_metadata, name)
+        info = await self.async_client.get_collection(name)
+        return getattr(info.config, "metadata", None) or {}
+
+    def upsert(self, name, ids, vectors, payloads):
+        from qdrant_client.models import PointStruct
+        prefix_dim = self._collection(name)[0].get(PREFIX_METADATA_KEY)
+        if prefix_dim:
+            vectors = [
+                {FULL_VECTOR: vector, PREFIX_VECTOR: reduce_dimension(vector, prefix_dim)} for vector in vectors
+            ]
+        points = [
+            PointStruct(id=point_id, vector=vector, payload=payload)
+            for point_id, vector, payload in zip(ids, vectors, payloads)
+        ]
+        self.client.upsert(collection_name=name, wait=True, points=points)
+
+    def delete(self, name, ids):
+        from qdrant_client.models import PointIdsList
+        self.client.delete(collection_name=name, points_selector=PointIdsList(points=list(ids)), wait=True)
+
+    def _query(self, name, collection, vector, limit, exact, with_vectors):
+        """query_points arguments: prefix prefetch + full-vector rescoring when enabled."""
+        from qdrant_client import models
+        metadata, params = collection
+        query = {"collection_name": name, "query": vector, "limit": limit, "search_params": params}
+        if with_vectors:
+            query["with_vectors"] = [FULL_VECTOR] if metadata.get(PREFIX_METADATA_KEY) else True
+        if exact:
+            query["search_params"] = models.SearchParams(exact=True)
+        prefix_dim = metadata.get(PREFIX_METADATA_KEY)
+        if prefix_dim:
+            query["using"] = FULL_VECTOR
+            if not exact:
+                query["prefetch"] = models.Prefetch(
+                    query=reduce_dimension(vector, prefix_dim),
+                    using=PREFIX_VECTOR,
+                    limit=limit * PREFIX_CANDIDATES,
+                    params=params,
+                )
+        return query
+
+    def search(self, name, vector, limit, exact=False, with_vectors=False):
+        """Top-`limit` points by cosine; `exact` bypasses HNSW and the prefix stage.
+
+        `with_vectors` adds each point's (full) vector to its result as "vector".
+        """
+        query = self._query(name, self._collection(name), vector, limit, exact, with_vectors)
+        return [_hit_result(hit) for hit in self.client.query_points(**query).points]
+
+    async def search_async(self, name, vector, limit, exact=False, with_vectors=False):
+        if self.async_client is None:
+            return await asyncio.to_thread(self.search, name, vector, limit, exact, with_vectors)
+        query = self._query(name, await self._collection_async(name), vector, limit, exact, with_vectors)
+        return [_hit_result(hit) for hit in (await self.async_client.query_points(**query)).points]
+
+    async def close_async(self):
+        """Closes the clients' connection pools (and releases a local-mode storage lock)."""
+        if self.async_client is not None:
+            await self.async_client.close()
+        self.client.close()
+
+
+class NumpyCollection:
+    """One collection loaded from disk: a memory-mapped (n, d) matrix plus payloads."""
+
+    def __init__(self, path):
+        import numpy as np
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dimension = meta["dimension"]
+        self.metadata = meta.get("metadata") or {}
+        count = meta["count"]
+        self.ids = []
+        self.payloads = []
+        with open(os.path.join(path, "points.jsonl"), "r", encoding="utf-8") as f:
+            for line in f:
+                if len(self.ids) >= count:
+                    break  # rows appended after meta.json was written
+                point = json.loads(line)
+                self.ids.append(point["id"])
+                self.payloads.append(point["payload"])
+        self.vectors = self._map(path, count)
+        self.rows = {point_id: row for row, point_id in enumerate(self.ids)}
+        # Renormalized prefix matrix held in RAM; full rows are only paged in for rescoring
+        self.prefix_dim = self.metadata.get(PREFIX_METADATA_KEY) or 0
+        self.prefix = _normalize_rows(np.array(self.vectors[:, :self.prefix_dim])) if self.prefix_dim else None
+
+    def _map(self, path, count):
+        import numpy as np
+        if not count:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r", shape=(count, self.dimension))
+
+    def extend(self, path, ids, payloads, matrix):
+        """Adds rows just appended to the files, remapping vectors.f32 instead of reloading everything."""
+        import numpy as np
+        start = len(self.ids)
+        self.ids.extend(ids)
+        self.payloads.extend(payloads)
+        self.rows.update((point_id, start + i) for i, point_id in enumerate(ids))
+        self.vectors = self._map(path, len(self.ids))
+        if self.prefix_dim:
+            self.prefix = np.vstack([self.prefix, _normalize_rows(matrix[:, :self.prefix_dim])])
+
+    def release(self):
+        """Drops this collection's mapping of vectors.f32 (Windows can't replace a mapped file)."""
+        import numpy as np
+        self.vectors = np.zeros((0, self.dimension), dtype=np.float32)
+
+    def _results(self, rows, scores, with_vectors):
+        return [
+            # Rows stay NumPy arrays: rerankers stack them without a list round-trip
+            _result(self.ids[row], self.payloads[row], score, self.vectors[row] if with_vectors else None)
+            for row, score in zip(rows, scores)
+        ]
+
+    def search(self, vector, limit, exact=False, with_vectors=False):
+        import numpy as np
+        if not self.ids:
+            return []
+        query = _normalize_rows(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        if self.prefix is not None and not exact:
+            coarse = self.prefix @ _normalize_rows(query[:self.prefix_dim].reshape(1, -1))[0]
+            candidates = np.sort(_top_k(coarse, limit * PREFIX_CANDIDATES))  # sorted for sequential mmap reads
+            scores = self.vectors[candidates] @ query
+            top = _top_k(scores, limit)
+            return self._results(candidates[top], scores[top], with_vectors)
+        scores = self.vectors @ query  # rows are stored unit-normalized
+        top = _top_k(scores, limit)
+        return self._results(top, scores[top], with_vectors)
+
+
+def _normalize_rows(matrix):
+    import numpy as np
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def _top_k(scores, k):
+    """Indices of the `k` highest scores, best first."""
+    import numpy as np
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class NumpyStore:
+    """Embedded store: one directory per collection under `root`.
+
+    Each directory holds vectors.f32 (unit-normalized float32 rows, read via
+    mmap), points.jsonl (id + payload per row, same order) and meta.json
+    (dimension, row count, metadata). New points are appended; replacing or
+    deleting points rewrites the files. meta.json is written last, so readers
+    only see rows that are complete. Search is an exact dot-product scan,
+    suited to corpora up to a few hundred thousand chunks.
+    """
+
+    def __init__(self, root=VECTOR_STORE_PATH):
+        self.root = root
+        self._loaded = {}  # name -> (meta.json mtime, NumpyCollection)
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _meta_path(self, name):
+        return os.path.join(self._path(name), "meta.json")
+
+    def _collection(self, name):
+        """Returns the loaded collection, reloading it if meta.json changed on disk."""
+        try:
+            mtime = os.stat(self._meta_path(name)).st_mtime_ns
+        except FileNotFoundError:
+            raise ValueError(f"Collection {name} not found in {self.root}")
+        cached = self._loaded.get(name)
+        if cached is None or cached[0] != mtime:
+            cached = self._loaded[name] = (mtime, NumpyCollection(self._path(name)))
+        return cached[1]
+
+    def _write_meta(self, name, dimension, count, metadata):
+        path = self._meta_path(name)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dimension": dimension, "count": count, "metadata": metadata or {}}, f)
+        os.replace(tmp, path)
+        return os.stat(path).st_mtime_ns
+
+    def _normalized(self, vectors, dimension):
+        import numpy as np
+        return _normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(-1, dimension))
+
+    def _rewrite(self, name, collection, ids, matrix, payloads):
+        path = self._path(name)
+        vectors_tmp = os.path.join(path, "vectors.f32.tmp")
+        with open(vectors_tmp, "wb") as f:
+            f.write(matrix.astype("float32").tobytes())
+        points_tmp = os.path.join(path, "points.jsonl.tmp")
+        with open(points_tmp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps({"id": i, "payload": p}) + "\n" for i, p in zip(ids, payloads))
+        # Drop every reference to the old mapping (the caller still holds `collection`)
+        self._loaded.pop(name, None)
+        collection.release()
+        os.replace(vectors_tmp, os.path.join(path, "vectors.f32"))
+        os.replace(points_tmp, os.path.join(path, "points.jsonl"))
+        self._write_meta(name, collection.dimension, len(ids), collection.metadata)
+
+    def collection_exists(self, name):
+        return os.path.exists(self._meta_path(name))
+
+    def create_collection(self, name, dimension, metadata=None, profile="default", prefix_dim=0):
+        """Creates an empty collection. Qdrant tuning profiles don't apply to this store."""
+        if profile != "default":
+            print(f"Note: tuning profile {profile} has no effect on the numpy vector store.")
+        metadata = dict(metadata or {})
+        if prefix_dim:
+            metadata[PREFIX_METADATA_KEY] = prefix_dim
+        path = self._path(name)
+        os.makedirs(path, exist_ok=True)
+        open(os.path.join(path, "vectors.f32"), "wb").close()
+        open(os.path.join(path, "points.jsonl"), "w", encoding="utf-8").close()
+        self._write_meta(name, dimension, 0, metadata)
+
+    def delete_collection(self, name):
+        import shutil
+        cached = self._loaded.pop(name, None)
+        if cached is not None:
+            cached[1].release()
+        shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def collection_metadata(self, name):
+        return self._collection(name).metadata
+
+    async def collection_metadata_async(self, name):
+        return self.collection_metadata(name)
+
+    def upsert(self, name, ids, vectors, payloads):
+        import numpy as np
+        collection = self._collection(name)
+        matrix = self._normalized(vectors, collection.dimension)
+        ids = list(ids)
+        payloads = list(payloads)
+        if any(point_id in collection.rows for point_id in ids):
+            # Replace rows in place by rewriting the collection
+            all_ids = list(collection.ids)
+            all_payloads = list(collection.payloads)
+            all_vectors = np.array(collection.vectors)
+            new_rows = []
+            for point_id, row_vector, payload in zip(ids, matrix, payloads):
+                row = collection.rows.get(point_id)
+                if row is None:
+                    all_ids.append(point_id)
+                    all_payloads.append(payload)
+                    new_rows.append(row_vector)
+                else:
+                    all_vectors[row] = row_vector
+                    all_payloads[row] = payload
+            if new_rows:
+                all_vectors = np.vstack([all_vectors, np.asarray(new_rows, dtype=np.float32)])
+            self._rewrite(name, collection, all_ids, all_vectors, all_payloads)
+            return
+
+        path = self._path(name)
+        with open(os.path.join(path, "vectors.f32"), "ab") as f:
+            f.write(matrix.tobytes())
+        with open(os.path.join(path, "points.jsonl"), "a", encoding="utf-8") as f:
+            f.writelines(json.dumps({"id": i, "payload": p}) + "\n" for i, p in zip(ids, payloads))
+        mtime = self._write_meta(name, collection.dimension, len(collection.ids) + len(ids), collection.metadata)
+        # Keep the loaded collection current so batched ingestion doesn't reload it per batch
+        collection.extend(path, ids, payloads, matrix)
+        self._loaded[name] = (mtime, collection)
+
+    def delete(self, name, ids):
+        collection = self._collection(name)
+        drop = set(ids)
+        keep = [row for row, point_id in enumerate(collection.ids) if point_id not in drop]
+        if len(keep) == len(collection.ids):
+            return
+        self._rewrite(
+            name,
+            collection,
+            [collection.ids[row] for row in keep],
+            collection.vectors[keep],
+            [collection.payloads[row] for row in keep],
+        )
+
+    def search(self, name, vector, limit, exact=False, with_vectors=False):
+        """Top-`limit` points by cosine; `exact` skips the prefix stage, `with_vectors` adds "vector"."""
+        return self._collection(name).search(vector, limit, exact, with_vectors)
+
+    async def search_async(self, name, vector, limit, exact=False, with_vectors=False):
+        # A thread hop costs more than scanning a small loaded collection, but a
+        # large scan (~70ms at 200k x 768) or a (re)load must not block the loop
+        cached = self._loaded.get(name)
+        if cached is not None and len(cached[1].ids) <= NUMPY_INLINE_ROWS:
+            return self.search(name, vector, limit, exact, with_vectors)
+        return await asyncio.to_thread(self.search, name, vector, limit, exact, with_vectors)
+
+    async def close_async(self):
+        self._loaded.clear()
+
+
+_store = None
+_store_lock = threading.Lock()  # the backend may create the store from its warm-up thread
+
+
+def create_store(kind):
+    if kind == "qdrant":
+        from qdrant_client import QdrantClient, AsyncQdrantClient
+        return QdrantStore(
+            QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=60),
+            # Async client used by the FastAPI backend so searches don't block the event loop
+            AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=60),
+        )
+    if kind == "qdrant_local":
+        from qdrant_client import QdrantClient
+        return QdrantStore(QdrantClient(path=QDRANT_PATH))
+    if kind == "numpy":
+        return NumpyStore(VECTOR_STORE_PATH)
+    raise ValueError(f"Unknown vector store: {kind} (expected qdrant, qdrant_local or numpy)")
+
+
+def get_store():
+    """Returns the configured store (VECTOR_STORE), created once per process."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = create_store(VECTOR_STORE)
+    return _store
+
+
+async def close_store_async():
+    """Closes the process-wide store, if it was ever created (backend shutdown)."""
+    global _store
+    with _store_lock:
+        store, _store = _store, None
+    if store is not None:
+        await store.close_async()
@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+from context_packing import merge_adjacent, overlap_length
+
+
+def hit(text, score, source="guide.pdf", chunk_index=0, **extra):
+    return dict(text=text, score=score, source=source, chunk_index=chunk_index, **extra)
+
+
+def test_overlap_length_needs_whole_words():
+    assert overlap_length("Alpha beta. Gamma delta.", "Gamma delta. Epsilon.") == len("Gamma delta.")
+    assert overlap_length("Alpha beta.", "Gamma delta.") == 0
+    assert overlap_length("Alpha beta", "eta gamma") == 0
+
+
+def test_merges_overlapping_neighbours():
+    hits = [
+        hit("Gamma delta. Epsilon zeta.", 0.9, chunk_index=1),
+        hit("Alpha beta. Gamma delta.", 0.5, chunk_index=0),
+    ]
+    merged = merge_adjacent(hits)
+    assert len(merged) == 1
+    assert merged[0]["text"] == "Alpha beta. Gamma delta. Epsilon zeta."
+    assert merged[0]["chunk_index"] == 0
+    assert merged[0]["score"] == 0.9
+
+
+def test_colliding_positions_keep_every_hit():
+    # Two PDFs with the same name attached to one conversation, each numbered from 0
+    first = hit("Refunds take five days.", 0.9, source="policy.pdf", file_key="a")
+    second = hit("Shipping is free.", 0.4, source="policy.pdf", file_key="b")
+    assert merge_adjacent([first, second]) == [first, second]
+
+    # Same source and chunk_index twice (a stale chunk_index left by an earlier ingest)
+    current = hit("Refunds take five days.", 0.9)
+    stale = hit("Unrelated older text.", 0.3)
+    assert merge_adjacent([current, stale]) == [current, stale]
+
+
+def test_non_overlapping_neighbours_stay_apart():
+    hits = [
+        hit("Pricing starts at ten dollars.", 0.8, chunk_index=4),
+        hit("The office is closed on Sundays.", 0.7, chunk_index=5),
+    ]
+    assert merge_adjacent(hits) == hits
+
+
+def test_hits_without_chunk_index_pass_through():
+    plain = {"text": "Loose text.", "score": 0.5, "source": "notes"}
+    assert merge_adjacent([plain]) == [plain]